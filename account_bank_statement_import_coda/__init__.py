@@ -2,4 +2,5 @@
 # Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from . import models
 from . import wizard
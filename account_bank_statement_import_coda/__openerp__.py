@@ -6,13 +6,17 @@
     'author': "ACSONE SA/NV,Odoo Community Association (OCA)",
     'website': "http://www.acsone.eu",
     'category': 'Accounting & Finance',
-    'version': '8.0.1.0.0',
+    'version': '8.0.1.1.0',
     'license': 'AGPL-3',
     'depends': [
         'account_bank_statement_import'
     ],
     'data': [
+        'security/ir.model.access.csv',
+        'data/ir_cron.xml',
         'views/account_bank_statement_view.xml',
+        'views/account_bank_statement_import_job_view.xml',
+        'views/account_bank_statement_import_folder_view.xml',
     ],
     'external_dependencies': {
         'python': ['coda'],
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Decoder of CODA files into compact records.
+
+It is an alternative to the pycoda parser, decoding only the records and
+the fields used by the import (record types 0, 1, 21, 22, 23, 31, 32, 33,
+8 and 9). The decoded statements, movements and informations have the
+attributes of the pycoda objects with the same values, so they are
+interchangeable in get_st_vals.
+"""
+
+import re
+import time
+
+CODA_HEADER = re.compile(r'0{5}\d{9}05[ D] {7}')
+
+DATE_FORMAT = '%Y-%m-%d'
+
+# Values of pycoda MovementRecordType
+NORMAL = '0'
+GLOBALISATION = '1'
+
+
+class CodaDecoderError(Exception):
+    pass
+
+
+class CodaStatement(object):
+    __slots__ = (
+        'version', 'acc_number', 'currency', 'old_balance',
+        'old_balance_amount_sign', 'old_balance_date', 'paper_seq_number',
+        'new_balance', 'new_balance_amount_sign', 'new_balance_date',
+        'movements', 'informations',
+    )
+
+    def __init__(self, version):
+        self.version = version
+        self.acc_number = None
+        self.currency = None
+        self.old_balance = None
+        self.old_balance_amount_sign = None
+        self.old_balance_date = None
+        self.paper_seq_number = None
+        self.new_balance = None
+        self.new_balance_amount_sign = None
+        self.new_balance_date = None
+        self.movements = []
+        self.informations = []
+
+
+class CodaMovement(object):
+    __slots__ = (
+        'ref', 'ref_move', 'ref_move_detail', 'transaction_ref',
+        'transaction_amount_sign', 'transaction_amount', 'transaction_type',
+        'transaction_date', 'communication', 'entry_date', 'type',
+        'counterparty_number', 'counterparty_name', 'counterparty_address',
+    )
+
+
+class CodaInformation(object):
+    __slots__ = ('ref', 'ref_move', 'transaction_ref', 'communication')
+
+
+def rmspaces(s):
+    return u' '.join(s.split())
+
+
+def join_communications(c1, c2):
+    if not c1:
+        return c2
+    if not c2:
+        return c1
+    if not c2.startswith(' '):
+        return ' '.join([c1, c2])
+    return c1 + c2
+
+
+class CodaDecoder(object):
+    """Decode CODA files, with the interface of the pycoda Parser"""
+
+    def __init__(self):
+        # the few dates of a file are converted once
+        self._dates = {}
+
+    def _date(self, value):
+        date = self._dates.get(value)
+        if date is None:
+            date = self._dates[value] = time.strftime(
+                DATE_FORMAT, time.strptime(rmspaces(value), '%d%m%y'))
+        return date
+
+    def parse(self, value):
+        """Return the list of the statements of the CODA file"""
+        value = value.decode('windows-1252', 'strict')
+        if CODA_HEADER.match(value) is None:
+            raise ValueError('The given value is not a valid coda content')
+        statements = []
+        statement = None
+        for line in value.split('\n'):
+            if not line:
+                continue
+            record_type = line[0]
+            if record_type == '0':
+                self._fix_globalisation_without_details(statement)
+                statement = self._decode_header(line)
+                statements.append(statement)
+            elif record_type == '1':
+                self._decode_header_details(line, statement)
+            elif record_type == '2':
+                self._decode_movement(line, statement)
+            elif record_type == '3':
+                self._decode_information(line, statement)
+            elif record_type == '8':
+                self._decode_new_balance(line, statement)
+        self._fix_globalisation_without_details(statement)
+        return statements
+
+    def _fix_globalisation_without_details(self, statement):
+        # a globalisation ending the statement has no details
+        if statement and statement.movements:
+            movement = statement.movements[-1]
+            if movement.type == GLOBALISATION:
+                movement.type = NORMAL
+
+    def _decode_header(self, line):
+        version = line[127]
+        if version not in ('1', '2'):
+            raise CodaDecoderError(
+                'CODA V%s statements are not supported, please contact your '
+                'bank' % version)
+        # the creation date is checked as pycoda does
+        self._date(line[5:11])
+        return CodaStatement(version)
+
+    def _decode_header_details(self, line, statement):
+        if statement.version == '1' or line[1] == '0':
+            # Belgian bank account BBAN structure
+            statement.acc_number = rmspaces(line[5:17])
+            statement.currency = rmspaces(line[18:21])
+        elif line[1] == '2':
+            # Belgian bank account IBAN structure
+            statement.acc_number = rmspaces(line[5:21])
+            statement.currency = rmspaces(line[39:42])
+        elif line[1] == '3':
+            # foreign bank account IBAN structure
+            statement.acc_number = rmspaces(line[5:39])
+            statement.currency = rmspaces(line[39:42])
+        elif line[1] == '1':
+            raise CodaDecoderError(
+                'Foreign bank accounts with BBAN structure are not supported')
+        else:
+            raise CodaDecoderError('Unsupported bank account structure')
+        statement.old_balance = float(rmspaces(line[43:58])) / 1000
+        statement.old_balance_amount_sign = line[42]
+        statement.old_balance_date = self._date(line[58:64])
+        statement.paper_seq_number = rmspaces(line[2:5])
+
+    def _decode_movement(self, line, statement):
+        if line[1] == '1':
+            movement = CodaMovement()
+            movement.ref = rmspaces(line[2:10])
+            movement.ref_move = rmspaces(line[2:6])
+            movement.ref_move_detail = rmspaces(line[6:10])
+            movement.transaction_ref = rmspaces(line[10:31])
+            movement.transaction_amount_sign = line[31]
+            movement.transaction_amount = float(rmspaces(line[32:47])) / 1000
+            movement.transaction_type = transaction_type = int(line[53])
+            movement.transaction_date = self._date(line[47:53])
+            if line[61] == '1':
+                movement.communication = '+++' + line[65:68] + '/' + \
+                    line[68:72] + '/' + line[72:77] + '+++'
+            else:
+                movement.communication = rmspaces(line[62:115])
+            movement.entry_date = self._date(line[115:121])
+            movement.counterparty_number = None
+            movement.counterparty_name = None
+            movement.counterparty_address = None
+            # a globalisation is normal when it is not followed by details
+            if transaction_type in (1, 2, 3):
+                movement.type = GLOBALISATION
+            else:
+                movement.type = NORMAL
+            movements = statement.movements
+            if movements and transaction_type < 4 and \
+                    movements[-1].type == GLOBALISATION:
+                movements[-1].type = NORMAL
+            movements.append(movement)
+        elif line[1] == '2':
+            movement = statement.movements[-1]
+            if movement.ref[0:4] != line[2:6]:
+                raise CodaDecoderError(
+                    'CODA parsing error on movement data record 2.2, seq nr '
+                    '%s!' % line[2:10])
+            movement.communication = join_communications(
+                movement.communication, rmspaces(line[10:63]))
+        elif line[1] == '3':
+            movement = statement.movements[-1]
+            if movement.ref[0:4] != line[2:6]:
+                raise CodaDecoderError(
+                    'CODA parsing error on movement data record 2.3, seq nr '
+                    '%s!' % line[2:10])
+            if statement.version == '1':
+                movement.counterparty_number = rmspaces(line[10:22])
+                movement.counterparty_name = rmspaces(line[47:73])
+                movement.counterparty_address = rmspaces(line[73:125])
+            else:
+                if line[22] == ' ':
+                    movement.counterparty_number = rmspaces(line[10:22])
+                else:
+                    movement.counterparty_number = rmspaces(line[10:44])
+                movement.counterparty_name = rmspaces(line[47:82])
+                movement.communication = join_communications(
+                    movement.communication, rmspaces(line[82:125]))
+        else:
+            raise CodaDecoderError(
+                'Movement data records of type 2.%s are not supported'
+                % line[1])
+
+    def _decode_information(self, line, statement):
+        if line[1] == '1':
+            information = CodaInformation()
+            information.ref = rmspaces(line[2:10])
+            information.ref_move = rmspaces(line[2:6])
+            information.transaction_ref = rmspaces(line[10:31])
+            information.communication = rmspaces(line[40:113])
+            statement.informations.append(information)
+        elif line[1] in ('2', '3'):
+            information = statement.informations[-1]
+            if information.ref != rmspaces(line[2:10]):
+                raise CodaDecoderError(
+                    'CODA parsing error on information data record 3.%s, '
+                    'seq nr %s!' % (line[1], line[2:10]))
+            information.communication += rmspaces(line[10:100])
+
+    def _decode_new_balance(self, line, statement):
+        statement.new_balance_amount_sign = line[41]
+        statement.new_balance = float(rmspaces(line[42:57])) / 1000
+        statement.new_balance_date = self._date(line[57:63])
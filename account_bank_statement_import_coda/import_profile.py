@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Durations, memory and record counters of the phases of a bank
+statement import."""
+
+import cProfile
+import json
+import pstats
+import resource
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from StringIO import StringIO
+
+# Number of functions reported by a cProfile capture
+CAPTURE_LIMIT = 40
+
+
+def _max_rss():
+    """Peak resident memory of the process, in kB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ImportProfile(object):
+    """Collect the duration and the growth of the peak memory of each
+    phase of an import, summed over all its calls, and counters of the
+    imported records. With capture, the import is also profiled by
+    cProfile.
+    """
+
+    def __init__(self, capture=False):
+        self.start = time.time()
+        self.max_rss = _max_rss()
+        self.phases = OrderedDict()
+        self.counters = Counter()
+        self.pending = {}
+        self.profiler = capture and cProfile.Profile() or None
+        self.capture_stats = None
+
+    def add(self, name, duration, max_rss_growth=0):
+        phase = self.phases.setdefault(name, {
+            'duration': 0.0,
+            'calls': 0,
+            'max_rss_growth': 0,
+        })
+        phase['duration'] += duration
+        phase['calls'] += 1
+        phase['max_rss_growth'] += max_rss_growth
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        max_rss = _max_rss()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start, _max_rss() - max_rss)
+
+    def begin(self, name):
+        """Start a phase ended by another method than the one starting
+        it."""
+        self.pending[name] = (time.time(), _max_rss())
+
+    def end(self, name):
+        if name in self.pending:
+            start, max_rss = self.pending.pop(name)
+            self.add(name, time.time() - start, _max_rss() - max_rss)
+
+    def count(self, name, number=1):
+        self.counters[name] += number
+
+    @contextmanager
+    def capture(self):
+        if self.profiler is None:
+            yield
+            return
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+            stream = StringIO()
+            pstats.Stats(self.profiler, stream=stream).sort_stats(
+                'cumulative').print_stats(CAPTURE_LIMIT)
+            self.capture_stats = stream.getvalue()
+
+    def as_dict(self):
+        return {
+            'duration': time.time() - self.start,
+            'max_rss_growth': _max_rss() - self.max_rss,
+            'phases': self.phases,
+            'counters': dict(self.counters),
+        }
+
+    def to_json(self):
+        return json.dumps(self.as_dict())
+
+    def report(self):
+        """Text report of the profile, with the cProfile statistics when
+        captured."""
+        report = json.dumps(self.as_dict(), indent=4)
+        if self.capture_stats:
+            report += '\n\n' + self.capture_stats
+        return report
+
+
+class NullImportProfile(object):
+    """Profile used when the import is not profiled"""
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    def begin(self, name):
+        pass
+
+    def end(self, name):
+        pass
+
+    def count(self, name, number=1):
+        pass
+
+
+NULL_PROFILE = NullImportProfile()
@@ -0,0 +1,11 @@
+# -*- encoding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from . import account_bank_statement_import_job
+from . import account_bank_statement_import_checkpoint
+from . import account_bank_statement_import_file
+from . import account_bank_statement_import_folder
+from . import res_partner_bank
+from . import account_invoice
+from . import account_bank_statement_line
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from openerp import fields, models
+
+
+class AccountBankStatementImportCheckpoint(models.Model):
+    """Progress of the import of a CODA file committed statement by
+    statement. A failed import of the same file resumes after the last
+    committed statement. The checkpoint is removed once the whole file is
+    imported.
+    """
+    _name = 'account.bank.statement.import.checkpoint'
+    _description = 'Bank Statement Import Checkpoint'
+
+    file_hash = fields.Char(required=True, readonly=True, index=True)
+    statement_count = fields.Integer(
+        'Imported Statements', readonly=True,
+        help='Number of statements of the file already imported, in the '
+             'order of the file.')
+    last_statement = fields.Char(
+        'Last Statement', readonly=True,
+        help='Name of the last imported statement, built from its paper '
+             'sequence number.')
+    statement_ids = fields.Many2many(
+        'account.bank.statement', string='Statements', readonly=True)
+
+    _sql_constraints = [
+        ('file_hash_uniq', 'unique (file_hash)',
+         'There is already a checkpoint for this file.'),
+    ]
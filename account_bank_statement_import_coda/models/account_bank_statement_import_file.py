@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from openerp import api, fields, models
+
+
+class AccountBankStatementImportFile(models.Model):
+    """Hash of a CODA file imported in a journal, with the statements
+    created by the import. A new upload of the same file is rejected from
+    its hash, before it is parsed.
+    """
+    _name = 'account.bank.statement.import.file'
+    _description = 'Imported Bank Statement File'
+    _rec_name = 'file_hash'
+
+    file_hash = fields.Char(required=True, readonly=True, index=True)
+    filename = fields.Char(readonly=True)
+    journal_id = fields.Many2one(
+        'account.journal', string='Journal', required=True, readonly=True,
+        ondelete='cascade')
+    statement_ids = fields.Many2many(
+        'account.bank.statement', string='Statements', readonly=True)
+
+    _sql_constraints = [
+        ('file_hash_journal_uniq', 'unique (file_hash, journal_id)',
+         'This file has already been imported in this journal.'),
+    ]
+
+    @api.model
+    def _get_imported_statements(self, file_hash, journal_id=None):
+        """Return the statements still existing of the previous imports of
+        the file, in the given journal if any. The imports whose statements
+        were all deleted are forgotten, so the file can be imported again.
+        """
+        domain = [('file_hash', '=', file_hash)]
+        if journal_id:
+            domain.append(('journal_id', '=', journal_id))
+        imported_files = self.search(domain)
+        imported_files.filtered(lambda f: not f.statement_ids).unlink()
+        return imported_files.exists().mapped('statement_ids')
+
+    @api.model
+    def _register(self, file_hash, statements, filename=None):
+        """Register the import of the file, once per journal of the
+        statements."""
+        for journal in statements.mapped('journal_id'):
+            journal_statements = statements.filtered(
+                lambda s: s.journal_id == journal)
+            imported_file = self.search([
+                ('file_hash', '=', file_hash),
+                ('journal_id', '=', journal.id)])
+            if imported_file:
+                imported_file.write({
+                    'statement_ids': [(4, s.id) for s in journal_statements],
+                })
+            else:
+                self.create({
+                    'file_hash': file_hash,
+                    'filename': filename,
+                    'journal_id': journal.id,
+                    'statement_ids': [(6, 0, journal_statements.ids)],
+                })
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import datetime
+import logging
+import os
+import shutil
+import time
+
+from openerp import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# files still being written by the transfer programs
+TEMPORARY_SUFFIXES = ('.tmp', '.part', '.filepart', '.partial')
+
+# Key of the advisory locks held by the runs of the drop folders
+FOLDER_LOCK = 1162297889
+
+
+class AccountBankStatementImportFolder(models.Model):
+    """A directory of the server polled by the cron for bank statement
+    files, for instance fetched by an external SFTP job. Each new file is
+    claimed by moving it to the processing subdirectory, imported by an
+    import job, then moved to the processed or failed directory. A file
+    left in the processing subdirectory by an interrupted run is taken
+    over by the next run.
+    """
+    _name = 'account.bank.statement.import.folder'
+    _description = 'Bank Statement Drop Folder'
+
+    name = fields.Char(required=True)
+    active = fields.Boolean(default=True)
+    path = fields.Char(
+        'Directory', required=True,
+        help='Directory of the server where the bank statement files to '
+             'import are dropped.')
+    processed_path = fields.Char(
+        'Processed Directory',
+        help='Directory where the imported files are moved. Defaults to the '
+             'processed subdirectory of the directory.')
+    failed_path = fields.Char(
+        'Failed Directory',
+        help='Directory where the files that could not be imported are '
+             'moved. Defaults to the failed subdirectory of the directory.')
+    journal_id = fields.Many2one(
+        'account.journal', string='Journal', domain=[('type', '=', 'bank')],
+        help='Journal of the imported statements. When empty, the journal '
+             'is found from the account number of each statement.')
+    user_id = fields.Many2one(
+        'res.users', string='User', required=True,
+        default=lambda self: self.env.user,
+        help='User importing the files.')
+    min_age = fields.Integer(
+        'Minimum Age (seconds)', required=True, default=60,
+        help='Files modified more recently are not imported yet, as they '
+             'may still be written by the transfer. Files ending with .tmp, '
+             '.part, .filepart or .partial are never imported.')
+    batch_size = fields.Integer(
+        'Files per Run', required=True, default=10,
+        help='Maximum number of files imported by each run of the scheduled '
+             'action, the oldest files first.')
+    job_ids = fields.One2many(
+        'account.bank.statement.import.job', 'folder_id', string='Jobs',
+        readonly=True)
+
+    @api.model
+    def run_drop_folders(self):
+        """Import the new files of the drop folders. Called by the cron."""
+        self.search([])._import_files()
+        return True
+
+    @api.multi
+    def action_import_files(self):
+        self._import_files()
+        return True
+
+    @api.multi
+    def _get_new_files(self):
+        """Return the paths of the next files to import, the oldest first"""
+        self.ensure_one()
+        if not os.path.isdir(self.path):
+            _logger.warning(
+                'Bank statement drop folder %s: %s is not a directory',
+                self.name, self.path)
+            return []
+        paths = [os.path.join(self.path, name)
+                 for name in os.listdir(self.path)
+                 if not name.startswith('.') and
+                 not name.lower().endswith(TEMPORARY_SUFFIXES)]
+        max_mtime = time.time() - self.min_age
+        mtimes = {}
+        for path in paths:
+            try:
+                if os.path.isfile(path):
+                    mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                # moved meanwhile
+                continue
+        paths = sorted((p for p, mtime in mtimes.iteritems()
+                        if mtime <= max_mtime), key=mtimes.get)
+        return paths[:max(self.batch_size, 1)]
+
+    @api.multi
+    def _claim_file(self, path):
+        """Move the file to the processing subdirectory, so that a
+        concurrent run of the folder does not import it too. Return its
+        new path, or None if another run claimed it first."""
+        self.ensure_one()
+        directory = os.path.join(self.path, 'processing')
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        target = os.path.join(directory, '%s-%s' % (
+            datetime.datetime.now().strftime('%Y%m%d%H%M%S%f'),
+            os.path.basename(path)))
+        try:
+            # atomic on the same file system
+            os.rename(path, target)
+        except OSError:
+            return None
+        return target
+
+    @api.multi
+    def _import_files(self):
+        for folder in self:
+            # the runs of a folder do not overlap, so a file of the
+            # processing subdirectory without job was left by an interrupted
+            # run
+            self.env.cr.execute(
+                "SELECT pg_try_advisory_lock(%s, %s)",
+                (FOLDER_LOCK, folder.id))
+            if not self.env.cr.fetchone()[0]:
+                continue
+            try:
+                folder._import_folder_files()
+            finally:
+                self.env.cr.execute(
+                    "SELECT pg_advisory_unlock(%s, %s)",
+                    (FOLDER_LOCK, folder.id))
+
+    @api.multi
+    def _get_processing_files(self):
+        """Return the paths of the files of the processing subdirectory"""
+        self.ensure_one()
+        directory = os.path.join(self.path, 'processing')
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.path.join(directory, name)
+                      for name in os.listdir(directory))
+
+    @api.multi
+    def _import_folder_files(self):
+        self.ensure_one()
+        job_model = self.env['account.bank.statement.import.job'].sudo()
+        jobs = job_model.search([
+            ('folder_id', '=', self.id),
+            ('file_path', 'in', self._get_processing_files())])
+        job_paths = set(jobs.mapped('file_path'))
+        # the files claimed by an interrupted run, then the new files
+        paths = [p for p in self._get_processing_files()
+                 if p not in job_paths]
+        for path in self._get_new_files():
+            path = self._claim_file(path)
+            if path is not None:
+                paths.append(path)
+        for path in paths:
+            # the job is committed with the file, which is only moved out
+            # of the processing subdirectory once the job is over
+            jobs |= self._create_job(path)
+            job_model._commit()
+        for job in jobs:
+            if job.state == 'pending':
+                job._run()
+            job.invalidate_cache()
+            if not os.path.exists(job.file_path):
+                # removed from the processing subdirectory meanwhile
+                pass
+            elif job.state == 'done':
+                self._move_file(job.file_path, self.processed_path or
+                                os.path.join(self.path, 'processed'),
+                                job.filename)
+            elif job.state == 'failed':
+                self._move_file(job.file_path, self.failed_path or
+                                os.path.join(self.path, 'failed'),
+                                job.filename)
+            else:
+                # run by another worker, moved by a next run
+                continue
+            job.file_path = False
+            job_model._commit()
+
+    @api.multi
+    def _create_job(self, path):
+        """Create the job importing a file of the processing subdirectory,
+        as the user of the folder"""
+        self.ensure_one()
+        # the name of a claimed file is prefixed by the time of its claim
+        filename = os.path.basename(path).split('-', 1)[-1]
+        job = self.env['account.bank.statement.import.job'].sudo().create({
+            'name': filename,
+            'filename': filename,
+            'journal_id': self.journal_id.id,
+            'user_id': self.user_id.id,
+            'company_id': self.user_id.company_id.id,
+            'folder_id': self.id,
+            'file_path': path,
+        })
+        job._set_data_file_from_path(path)
+        return job
+
+    @api.model
+    def _move_file(self, path, directory, filename=None):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        target = os.path.join(directory, filename or os.path.basename(path))
+        if os.path.exists(target):
+            root, ext = os.path.splitext(target)
+            target = '%s-%s%s' % (
+                root, datetime.datetime.now().strftime('%Y%m%d%H%M%S%f'), ext)
+        shutil.move(path, target)
+        _logger.info('Bank statement file %s moved to %s', path, target)
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import base64
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+
+import openerp
+from openerp import SUPERUSER_ID, api, fields, models
+from openerp.exceptions import Warning as UserError
+from openerp.tools import mute_logger
+from openerp.tools.translate import _
+
+_logger = logging.getLogger(__name__)
+
+# Size of the chunks of the files of the server copied to the filestore
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Key of the advisory locks held by the connections running the jobs
+JOB_LOCK = 1162297888
+
+# Savepoint standing for the commits of the jobs in the test transaction
+TEST_COMMIT_SAVEPOINT = 'bank_statement_import_job_commit'
+
+
+class AccountBankStatementImportJob(models.Model):
+    """A bank statement file imported in background by the cron, so that
+    the import of large files is not bound to the duration of a request.
+    """
+    _name = 'account.bank.statement.import.job'
+    _description = 'Bank Statement Import Job'
+    _order = 'id desc'
+
+    name = fields.Char(required=True, readonly=True)
+    data_file = fields.Binary(
+        'Bank Statement File', readonly=True,
+        compute='_compute_data_file', inverse='_inverse_data_file')
+    attachment_id = fields.Many2one(
+        'ir.attachment', string='Attachment', readonly=True)
+    filename = fields.Char(readonly=True)
+    journal_id = fields.Many2one(
+        'account.journal', string='Journal', readonly=True)
+    user_id = fields.Many2one(
+        'res.users', string='User', required=True, readonly=True,
+        default=lambda self: self.env.user)
+    company_id = fields.Many2one(
+        'res.company', string='Company', required=True, readonly=True,
+        default=lambda self: self.env.user.company_id)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')],
+        required=True, readonly=True, default='pending')
+    date_start = fields.Datetime('Started on', readonly=True)
+    date_done = fields.Datetime('Finished on', readonly=True)
+    statement_count = fields.Integer(
+        'Imported Statements', readonly=True,
+        help='Number of statements imported so far.')
+    statement_ids = fields.Many2many(
+        'account.bank.statement', string='Statements', readonly=True)
+    result = fields.Text(readonly=True)
+    profile = fields.Text(
+        readonly=True,
+        help='Duration, memory and record counters of each phase of the '
+             'last run of the import.')
+    folder_id = fields.Many2one(
+        'account.bank.statement.import.folder', string='Drop Folder',
+        readonly=True, ondelete='set null',
+        help='Drop folder of the imported file.')
+    file_path = fields.Char(
+        'Server File', readonly=True,
+        help='File of the drop folder being imported, moved to the '
+             'processed or failed directory when the job is over.')
+    commit_batch = fields.Integer(
+        'Statements per Commit', required=True, default=1,
+        help='The import of a CODA file is committed every time this number '
+             'of statements is imported. If the job fails, running it '
+             'again resumes the import after the last committed statement.')
+
+    @api.multi
+    @api.depends('attachment_id')
+    def _compute_data_file(self):
+        for job in self:
+            job.data_file = job.attachment_id.datas
+
+    @api.multi
+    def _inverse_data_file(self):
+        """Store the file in an attachment, kept in the filestore by
+        default, to read it without loading it in memory."""
+        for job in self:
+            attachment = job.attachment_id
+            job.attachment_id = self.env['ir.attachment'].create({
+                'name': job.filename or job.name,
+                'datas_fname': job.filename,
+                'datas': job.data_file,
+                'res_model': self._name,
+                'res_id': job.id,
+            })
+            attachment.unlink()
+
+    @api.model
+    def _check_user(self, vals):
+        """The import runs as the user of the job: only the administrators
+        may run it as another user."""
+        if vals.get('user_id') and vals['user_id'] != self.env.uid and \
+                self.env.uid != SUPERUSER_ID and \
+                not self.env.user.has_group('base.group_system'):
+            raise UserError(
+                _('You can not import bank statements as another user.'))
+
+    @api.model
+    def create(self, vals):
+        self._check_user(vals)
+        return super(AccountBankStatementImportJob, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        self._check_user(vals)
+        return super(AccountBankStatementImportJob, self).write(vals)
+
+    @api.multi
+    def unlink(self):
+        attachments = self.mapped('attachment_id')
+        res = super(AccountBankStatementImportJob, self).unlink()
+        attachments.unlink()
+        return res
+
+    @api.multi
+    def _set_data_file_from_path(self, path):
+        """Store a file of the server in the attachment of the job, copied
+        to the filestore instead of being encoded in memory"""
+        self.ensure_one()
+        attachment_model = self.env['ir.attachment']
+        if attachment_model._storage() != 'file':
+            with open(path, 'rb') as data_file:
+                self.data_file = base64.b64encode(data_file.read())
+            return
+        # same file name as the attachments stored by ir.attachment
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as data_file:
+            for chunk in iter(lambda: data_file.read(COPY_CHUNK_SIZE), ''):
+                sha1.update(chunk)
+        fname = sha1.hexdigest()
+        store_fname = '%s/%s' % (fname[:3], fname)
+        full_path = attachment_model._full_path(store_fname)
+        if not os.path.exists(full_path):
+            if not os.path.isdir(os.path.dirname(full_path)):
+                os.makedirs(os.path.dirname(full_path))
+            shutil.copyfile(path, full_path)
+        self.attachment_id = attachment_model.create({
+            'name': self.filename or self.name,
+            'datas_fname': self.filename,
+            'store_fname': store_fname,
+            'file_size': os.path.getsize(path),
+            'res_model': self._name,
+            'res_id': self.id,
+        })
+
+    @api.multi
+    @contextmanager
+    def _open_data_file(self):
+        """Give the content of the file as a read-only memory map of the
+        attachment when it is in the filestore, so that the import reads
+        the file statement by statement instead of loading it at once."""
+        self.ensure_one()
+        attachment = self.attachment_id.sudo()
+        if not attachment.store_fname:
+            yield base64.b64decode(attachment.datas or '')
+            return
+        path = attachment._full_path(attachment.store_fname)
+        with open(path, 'rb') as data_file:
+            if not os.fstat(data_file.fileno()).st_size:
+                # an empty file can not be mapped
+                yield ''
+                return
+            data_map = mmap.mmap(
+                data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield data_map
+            finally:
+                data_map.close()
+
+    @api.model
+    def _commit(self):
+        # the test cursor must not be committed: a savepoint stands for the
+        # commit, rolled back to by a failed job
+        if getattr(threading.currentThread(), 'testing', False):
+            self.env.cr.execute('SAVEPOINT %s' % TEST_COMMIT_SAVEPOINT)
+        else:
+            self.env.cr.commit()
+
+    @api.model
+    def _rollback(self):
+        """Roll back to the last commit"""
+        if getattr(threading.currentThread(), 'testing', False):
+            self.env.cr.execute(
+                'ROLLBACK TO SAVEPOINT %s' % TEST_COMMIT_SAVEPOINT)
+        else:
+            self.env.cr.rollback()
+        self.env.invalidate_all()
+
+    @api.multi
+    def _try_lock(self):
+        """Take the advisory lock of the job, held by the connection until
+        _unlock, even across commits. Return whether it was taken."""
+        self.ensure_one()
+        self.env.cr.execute(
+            "SELECT pg_try_advisory_lock(%s, %s)", (JOB_LOCK, self.id))
+        return self.env.cr.fetchone()[0]
+
+    @api.multi
+    def _unlock(self):
+        self.ensure_one()
+        self.env.cr.execute(
+            "SELECT pg_advisory_unlock(%s, %s)", (JOB_LOCK, self.id))
+
+    @api.model
+    def _fail_stale_jobs(self):
+        """Mark as failed the running jobs whose worker was killed or
+        restarted, so that they can be retried. A running job holds its
+        lock, released with the connection of its worker."""
+        stale_jobs = self.browse()
+        for job in self.search([('state', '=', 'running')]):
+            if not job._try_lock():
+                continue
+            try:
+                # the state is read again, the job may have ended meanwhile
+                self.env.cr.execute(
+                    "UPDATE account_bank_statement_import_job "
+                    "SET state = 'failed', date_done = %s, result = %s "
+                    "WHERE id = %s AND state = 'running'",
+                    (fields.Datetime.now(),
+                     _('The import was interrupted. Retry to resume it '
+                       'after the last committed statement.'), job.id))
+                if self.env.cr.rowcount:
+                    _logger.warning(
+                        'Bank statement import job %s interrupted', job.name)
+                    stale_jobs |= job
+                self._commit()
+            finally:
+                job._unlock()
+        stale_jobs.invalidate_cache()
+        return stale_jobs
+
+    @api.model
+    def run_pending_jobs(self):
+        """Run the pending jobs. Called by the cron."""
+        self._fail_stale_jobs()
+        for job in self.search([('state', '=', 'pending')], order='id'):
+            job._run()
+        return True
+
+    @api.multi
+    def action_run(self):
+        """Have the cron run the pending jobs now. The jobs are not run in
+        the request, whose duration is limited."""
+        cron = self.env.ref(
+            'account_bank_statement_import_coda.'
+            'ir_cron_bank_statement_import_job', False)
+        if not cron:
+            return True
+        try:
+            with self.env.cr.savepoint(), \
+                    mute_logger('openerp.sql_db'):
+                self.env.cr.execute(
+                    "SELECT id FROM ir_cron WHERE id = %s FOR UPDATE NOWAIT",
+                    (cron.id,))
+                cron.sudo().write({'nextcall': fields.Datetime.now()})
+        except psycopg2.OperationalError:
+            # the cron is running, it runs the pending jobs after the
+            # current ones
+            pass
+        return True
+
+    @api.multi
+    def action_retry(self):
+        """Run a failed job again, or a job interrupted while running. A
+        CODA file is imported from the last statement committed by the
+        failed run."""
+        if any(job.state == 'running' for job in self):
+            self._fail_stale_jobs()
+            self.invalidate_cache()
+        self.filtered(lambda j: j.state == 'failed').write(
+            {'state': 'pending', 'result': False})
+        return True
+
+    @api.multi
+    def _run(self):
+        for job in self:
+            # the lock is taken before the job, so that a running job is
+            # never taken for an interrupted one
+            if not job._try_lock():
+                continue
+            try:
+                job._run_locked()
+            finally:
+                job._unlock()
+
+    @api.multi
+    def _run_locked(self):
+        for job in self:
+            # the job is taken with a committed update, so that another
+            # cron worker running at the same time leaves it alone
+            self.env.cr.execute(
+                "UPDATE account_bank_statement_import_job "
+                "SET state = 'running', date_start = %s "
+                "WHERE id = %s AND state = 'pending'",
+                (fields.Datetime.now(), job.id))
+            if not self.env.cr.rowcount:
+                continue
+            self._commit()
+            job.invalidate_cache()
+            import_model = self.env['account.bank.statement.import'].sudo(
+                job.user_id.id)
+            profile = import_model._new_import_profile()
+            import_model = import_model.with_context(
+                journal_id=job.journal_id.id,
+                filename=job.filename,
+                bank_statement_import_job_id=job.id,
+                coda_commit_batch=max(job.commit_batch, 1),
+                coda_import_profile=profile)
+            profile.begin('decode')
+            error = None
+            try:
+                with job._open_data_file() as data_file, profile.capture():
+                    statement_ids, notifications = \
+                        import_model._import_file(data_file)
+            except Exception, e:
+                # back to the last statement committed by the import
+                self._rollback()
+                _logger.exception(
+                    'Error when running bank statement import job %s',
+                    job.name)
+                error = getattr(e, 'message', None) or \
+                    getattr(e, 'value', None) or repr(e)
+            # the import is committed before the job is updated, as the job
+            # was updated by _set_progress in another transaction
+            self._commit()
+            job.invalidate_cache()
+            import_model._log_import_profile(profile)
+            if error:
+                job.write({
+                    'state': 'failed',
+                    'date_done': fields.Datetime.now(),
+                    'result': error,
+                    'profile': profile.report(),
+                })
+            else:
+                job.write({
+                    'state': 'done',
+                    'date_done': fields.Datetime.now(),
+                    'profile': profile.report(),
+                    'statement_count': len(statement_ids),
+                    'statement_ids': [(6, 0, statement_ids)],
+                    'result': '\n'.join(
+                        n['message'] for n in notifications) or
+                    _('%d statements imported.') % len(statement_ids),
+                })
+            self._commit()
+
+    @api.multi
+    def _set_progress(self, statement_count):
+        """Record the number of statements imported so far. The progress is
+        written and committed by a new cursor to be visible while the job
+        runs."""
+        self.ensure_one()
+        if getattr(threading.currentThread(), 'testing', False):
+            self.statement_count = statement_count
+            return
+        with api.Environment.manage():
+            with openerp.registry(self.env.cr.dbname).cursor() as cr:
+                cr.execute(
+                    "UPDATE account_bank_statement_import_job "
+                    "SET statement_count = %s WHERE id = %s",
+                    (statement_count, self.id))
+
+    @api.multi
+    def action_open_statements(self):
+        self.ensure_one()
+        action = self.env.ref('account.action_bank_statement_tree').read()[0]
+        action['domain'] = [('id', 'in', self.statement_ids.ids)]
+        return action
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from openerp import fields, models
+
+
+class AccountBankStatementLine(models.Model):
+    _inherit = 'account.bank.statement.line'
+
+    invoice_id = fields.Many2one(
+        'account.invoice', string='Proposed Invoice', readonly=True,
+        help='Open invoice whose reference is the structured communication '
+             'of the line, found when the statement was imported. Its '
+             'receivable or payable move lines are proposed by the '
+             'reconciliation.')
+
+    def get_reconciliation_proposition(self, cr, uid, st_line,
+                                       excluded_ids=None, context=None):
+        """Propose the open receivable or payable move lines of the invoice
+        found when the statement was imported"""
+        invoice = st_line.invoice_id
+        if invoice and invoice.state == 'open':
+            excluded_ids = excluded_ids or []
+            move_lines = invoice.move_id.line_id.filtered(
+                lambda l: l.account_id == invoice.account_id and
+                not l.reconcile_id and l.id not in excluded_ids)
+            if move_lines:
+                target_currency = (
+                    st_line.currency_id or st_line.journal_id.currency or
+                    st_line.journal_id.company_id.currency_id)
+                return self.pool['account.move.line'].\
+                    prepare_move_lines_for_reconciliation_widget(
+                        cr, uid, move_lines, target_currency=target_currency,
+                        target_date=st_line.date, context=context)
+        return super(AccountBankStatementLine, self).\
+            get_reconciliation_proposition(
+                cr, uid, st_line, excluded_ids=excluded_ids, context=context)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import re
+
+from openerp import api, models
+
+# SQL expression of the digits of an invoice reference, matching
+# normalize_bba for the structured communications
+NORMALIZED_REFERENCE = "regexp_replace(reference, '[^0-9]', '', 'g')"
+
+# Belgian structured communication, +++123/4567/89012+++ or
+# ***123/4567/89012***
+BBA_PATTERN = re.compile(
+    r'^\s*(\+{3}|\*{3})\s*(\d{3})\s*/\s*(\d{4})\s*/\s*(\d{5})\s*\1\s*$')
+
+
+def normalize_bba(communication):
+    """Return the 12 digits of a valid Belgian structured communication
+    (+++123/4567/89012+++), or None for any other text."""
+    match = BBA_PATTERN.match(communication or '')
+    if not match:
+        return None
+    digits = ''.join(match.groups()[1:])
+    check = int(digits[:10]) % 97 or 97
+    if check != int(digits[10:]):
+        return None
+    return digits
+
+
+class AccountInvoice(models.Model):
+    _inherit = 'account.invoice'
+
+    def init(self, cr):
+        cr.execute(
+            "SELECT 1 FROM pg_indexes WHERE indexname = %s",
+            ('account_invoice_open_normalized_reference_index',))
+        if not cr.fetchone():
+            cr.execute(
+                "CREATE INDEX account_invoice_open_normalized_reference_index "
+                "ON account_invoice (%s) WHERE state = 'open'" %
+                NORMALIZED_REFERENCE)
+
+    @api.model
+    def _get_open_invoice_bba_index(self, bbas):
+        """Return a dict mapping (structured communication digits, invoice
+        type) to the open invoice having this reference, found with a
+        single query."""
+        if not bbas:
+            return {}
+        self.env.cr.execute(
+            "SELECT id FROM account_invoice "
+            "WHERE state = 'open' AND %s IN %%s" % NORMALIZED_REFERENCE,
+            (tuple(set(bbas)),))
+        invoice_ids = [r[0] for r in self.env.cr.fetchall()]
+        index = {}
+        # the free text references having the same digits are left out
+        for invoice in self.search([('id', 'in', invoice_ids)]):
+            if not normalize_bba(invoice.reference):
+                continue
+            index.setdefault(
+                (normalize_bba(invoice.reference), invoice.type), invoice)
+        return index
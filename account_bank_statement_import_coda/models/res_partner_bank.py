@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import re
+
+from openerp import api, models
+
+# SQL expression of a bank account number without spaces nor separators,
+# in upper case, matching normalize_acc_number
+NORMALIZED_ACC_NUMBER = \
+    "upper(regexp_replace(acc_number, '[^0-9A-Za-z]', '', 'g'))"
+
+
+def normalize_acc_number(acc_number):
+    """Return an IBAN or BBAN without spaces nor separators, in upper
+    case."""
+    return re.sub(r'[^0-9A-Za-z]', '', acc_number or '').upper()
+
+
+class ResPartnerBank(models.Model):
+    _inherit = 'res.partner.bank'
+
+    def init(self, cr):
+        cr.execute(
+            "SELECT 1 FROM pg_indexes WHERE indexname = %s",
+            ('res_partner_bank_normalized_acc_number_index',))
+        if not cr.fetchone():
+            cr.execute(
+                "CREATE INDEX res_partner_bank_normalized_acc_number_index "
+                "ON res_partner_bank (%s)" % NORMALIZED_ACC_NUMBER)
+
+    @api.model
+    def _get_normalized_acc_number_index(self, acc_numbers):
+        """Return a dict mapping the given normalized account numbers to
+        the first matching bank account, found with a single query."""
+        acc_numbers = set(normalize_acc_number(n) for n in acc_numbers)
+        acc_numbers.discard('')
+        if not acc_numbers:
+            return {}
+        index = {}
+        self.env.cr.execute(
+            "SELECT id FROM res_partner_bank WHERE %s IN %%s" %
+            NORMALIZED_ACC_NUMBER, (tuple(acc_numbers),))
+        bank_ids = [r[0] for r in self.env.cr.fetchall()]
+        # search applies the record rules and the order of the model
+        for bank in self.search([('id', 'in', bank_ids)]):
+            index.setdefault(normalize_acc_number(bank.acc_number), bank)
+        return index
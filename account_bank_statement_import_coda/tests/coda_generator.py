@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Generator of synthetic CODA files following the febelfin
+specifications (version 2), used to benchmark the import.
+"""
+
+import datetime
+import random
+
+RECORD_LENGTH = 128
+
+
+def _record(*fields):
+    """Build a CODA record from (position, value) pairs. The positions
+    are the 0 based offsets of the febelfin specifications."""
+    record = [' '] * RECORD_LENGTH
+    for position, value in fields:
+        record[position:position + len(value)] = list(value)
+    return ''.join(record[:RECORD_LENGTH])
+
+
+def _date(date):
+    return date.strftime('%d%m%y')
+
+
+def _amount(amount):
+    return '%015d' % int(round(abs(amount) * 1000))
+
+
+def _sign(amount):
+    return amount < 0 and '1' or '0'
+
+
+def _movement(ref_move, ref_detail, transaction_ref, amount, date,
+              transaction_type, communication, structured, paper_seq,
+              has_details, has_informations):
+    records = []
+    if structured:
+        communication_fields = [(61, '1'), (62, '101'),
+                                (65, communication)]
+    else:
+        communication_fields = [(61, '0'), (62, communication[:53])]
+    records.append(_record(
+        (0, '21'), (2, ref_move), (6, ref_detail),
+        (10, transaction_ref), (31, _sign(amount)),
+        (32, _amount(amount)), (47, _date(date)),
+        (53, transaction_type + '01' + '50' + '000'),
+        (115, _date(date)), (121, paper_seq), (124, '0'),
+        (125, has_details and '1' or '0'),
+        (127, has_informations and '1' or '0'),
+        *communication_fields))
+    if has_details:
+        records.append(_record(
+            (0, '22'), (2, ref_move), (6, ref_detail),
+            (98, 'GKCCBEBB'), (125, '1'),
+            (127, has_informations and '1' or '0')))
+        records.append(_record(
+            (0, '23'), (2, ref_move), (6, ref_detail),
+            (10, 'BE61310126985517'), (47, 'PARTNER %s' % ref_move),
+            (125, '0'), (127, has_informations and '1' or '0')))
+    return records
+
+
+def _information(ref_move, transaction_ref, index):
+    return [
+        _record((0, '31'), (2, ref_move), (6, '0001'),
+                (10, transaction_ref), (31, '0'), (32, '01500001'),
+                (39, '0'), (40, '001PARTNER %s INFO %s' % (ref_move, index)),
+                (125, '1'), (127, '0')),
+        _record((0, '32'), (2, ref_move), (6, '0001'),
+                (10, 'MOLENSTRAAT %s 9340 LEDE' % index),
+                (125, '0'), (127, '0')),
+    ]
+
+
+def generate_coda(statements=1, movements=10, globalisations=0,
+                  globalisation_details=3, informations=0,
+                  acc_number='BE46737018594236', currency='EUR',
+                  balance=0.0, date=datetime.date(2012, 1, 11),
+                  first_paper_seq=1, seed=None):
+    """Return the content of a CODA file.
+
+    :param statements: number of statements (one per day from date), each
+        one with its own header and trailer records
+    :param movements: number of simple movements per statement
+    :param globalisations: number of globalisations per statement
+    :param globalisation_details: number of movements of a globalisation
+    :param informations: number of movements per statement followed by
+        information records
+    :param seed: seed of the random amounts and communications
+    """
+    rand = random.Random(seed)
+    coda = []
+    for st_index in range(statements):
+        st_date = date + datetime.timedelta(days=st_index)
+        paper_seq = '%03d' % ((first_paper_seq + st_index) % 1000)
+        old_balance = balance
+        debit = credit = 0.0
+        # each statement is a complete CODA record set, from the header
+        # record (0) to the trailer record (9)
+        records = [_record(
+            (0, '00000'), (5, _date(st_date)), (11, '725'), (14, '05'),
+            (16, '        '), (24, '00178299'), (34, 'SYNTHETIC CODA'),
+            (60, 'KREDBEBB'), (71, '00820512012'), (83, '00000'),
+            (127, '2'))]
+        records.append(_record(
+            (0, '12'), (2, paper_seq), (5, acc_number), (39, currency),
+            (42, _sign(old_balance)), (43, _amount(old_balance)),
+            (58, _date(st_date)), (64, 'SYNTHETIC NV'),
+            (90, 'Synthetic account'), (125, paper_seq)))
+        ref_move = 0
+        for mv_index in range(movements + globalisations):
+            ref_move += 1
+            move = '%04d' % (ref_move % 10000)
+            transaction_ref = ('SYN%03d%05d%s' % (
+                st_index % 1000, ref_move % 100000, 'X' * 13))[:21]
+            if mv_index < movements:
+                amount = round(rand.uniform(-1000, 1000), 2) or 1.0
+                structured = rand.random() < 0.5
+                if structured:
+                    communication = '%012d' % rand.randint(0, 10 ** 12 - 1)
+                else:
+                    communication = 'COMMUNICATION %s %s' % (
+                        paper_seq, move)
+                has_informations = mv_index < informations
+                records += _movement(
+                    move, '0000', transaction_ref, amount, st_date, '0',
+                    communication, structured, paper_seq, True,
+                    has_informations)
+                if has_informations:
+                    records += _information(move, transaction_ref,
+                                            mv_index)
+            else:
+                details = [round(rand.uniform(1, 500), 2)
+                           for __ in range(globalisation_details)]
+                amount = -sum(details)
+                records += _movement(
+                    move, '0000', transaction_ref, amount, st_date, '1',
+                    'GLOBALISATION %s %s' % (paper_seq, move), False,
+                    paper_seq, False, False)
+                for detail_index, detail in enumerate(details, 1):
+                    records += _movement(
+                        move, '%04d' % detail_index, transaction_ref,
+                        -detail, st_date, '5', '', False, paper_seq,
+                        False, False)
+            balance += amount
+            if amount < 0:
+                debit -= amount
+            else:
+                credit += amount
+        records.append(_record(
+            (0, '8'), (1, paper_seq), (4, acc_number), (41, _sign(balance)),
+            (42, _amount(balance)), (57, _date(st_date)), (127, '0')))
+        records.append(_record(
+            (0, '9'), (16, '%06d' % ((len(records) - 1) % 1000000)),
+            (22, _amount(debit)), (37, _amount(credit)),
+            (127, st_index == statements - 1 and '2' or '1')))
+        coda += records
+    return '\r\n'.join(coda) + '\r\n'
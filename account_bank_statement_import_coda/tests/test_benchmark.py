@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+import os
+import resource
+import time
+
+from openerp.tests.common import TransactionCase
+
+from coda.parser import Parser
+
+from .coda_generator import generate_coda
+
+_logger = logging.getLogger(__name__)
+
+# Time budgets, in seconds per 1000 movements of a synthetic CODA file.
+# They are far above the actual timings so that only a real performance
+# regression makes the tests fail. As the timings depend on the load of
+# the host, they are only checked when the CODA_BENCHMARK environment
+# variable is set; otherwise only the results are checked.
+BENCHMARK = bool(os.environ.get('CODA_BENCHMARK'))
+PARSE_BUDGET = 2.0
+NATIVE_PARSE_BUDGET = 1.0
+ST_VALS_BUDGET = 1.0
+IMPORT_BUDGET = 20.0
+
+
+class TestCodaBenchmark(TransactionCase):
+    """Throughput benchmark of the CODA import on synthetic files
+    """
+
+    def setUp(self):
+        super(TestCodaBenchmark, self).setUp()
+        self.env['res.partner.bank'].create({
+            'state': 'bank',
+            'acc_number': 'BE46737018594236',
+            'bank_bic': 'KREDBEBB',
+            'journal_id': self.ref('account.bank_journal'),
+            'partner_id': self.ref('base.main_partner'),
+        })
+        fy = self.env['account.fiscalyear'].create({
+            'name': 'FY 2012',
+            'code': '2012',
+            'date_start': '2012-01-01',
+            'date_stop': '2012-12-31',
+            'company_id': self.ref('base.main_company'),
+        })
+        self.env['account.period'].create({
+            'name': 'FP 2012-01',
+            'code': '2012-01',
+            'date_start': '2012-01-01',
+            'date_stop': '2012-01-31',
+            'company_id': self.ref('base.main_company'),
+            'fiscalyear_id': fy.id,
+        })
+        self.statement_import_model = self.env[
+            'account.bank.statement.import']
+
+    def _measure(self, name, movements, budget, func, *args):
+        """Call func and, when benchmarking, check its duration against
+        the budget. The duration and the growth of the peak memory of the
+        process are logged."""
+        if not BENCHMARK:
+            return func(*args)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        result = func(*args)
+        duration = time.time() - start
+        max_rss_growth = \
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - max_rss
+        _logger.info(
+            "CODA benchmark %s: movements=%d duration=%.3fs "
+            "max_rss_growth=%dkB", name, movements, duration, max_rss_growth)
+        self.assertLess(
+            duration, budget * movements / 1000.0,
+            "%s of %d movements took %.3fs" % (name, movements, duration))
+        return result
+
+    def test_benchmark_parse_file(self):
+        data_file = generate_coda(
+            statements=20, movements=200, globalisations=20,
+            informations=50, seed=1)
+        stmts_vals = self._measure(
+            '_parse_file', 20 * 280, PARSE_BUDGET,
+            self.statement_import_model._parse_file, data_file)
+        self.assertEqual(len(stmts_vals), 20)
+        self.assertEqual(
+            sum(len(st_vals['transactions']) for st_vals in stmts_vals),
+            20 * 260)
+
+    def test_benchmark_native_decoder(self):
+        data_file = generate_coda(
+            statements=20, movements=200, globalisations=20,
+            informations=50, seed=1)
+        pycoda_vals = self._measure(
+            '_parse_file pycoda', 20 * 280, PARSE_BUDGET,
+            self.statement_import_model._parse_file, data_file)
+        native_vals = self._measure(
+            '_parse_file native', 20 * 280, NATIVE_PARSE_BUDGET,
+            self.statement_import_model.with_context(
+                coda_decoder='native')._parse_file, data_file)
+        self.assertEqual(native_vals, pycoda_vals)
+
+    def test_benchmark_get_st_vals(self):
+        data_file = generate_coda(
+            statements=20, movements=200, globalisations=20,
+            informations=50, seed=1)
+        statements = Parser().parse(data_file)
+        self._measure(
+            'get_st_vals', 20 * 280, ST_VALS_BUDGET,
+            lambda: [self.statement_import_model.get_st_vals(statement)
+                     for statement in statements])
+
+    def test_benchmark_import_file(self):
+        data_file = generate_coda(
+            statements=5, movements=200, globalisations=10,
+            informations=50, seed=1)
+        bank_statement_import = self.statement_import_model.create(
+            {'data_file': data_file.encode('base64')})
+        self._measure(
+            'import_file', 5 * 240, IMPORT_BUDGET,
+            bank_statement_import.import_file)
+        statements = self.env['account.bank.statement'].search([
+            ('name', 'like', 'TBNK/2012/00%')])
+        self.assertEqual(len(statements), 5)
+        self.assertEqual(len(statements.mapped('line_ids')), 5 * 230)
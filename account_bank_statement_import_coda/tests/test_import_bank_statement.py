@@ -2,10 +2,25 @@
 # Copyright 2015-2016 ACSONE SA/NV (<http://acsone.eu>)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from contextlib import closing
+from zipfile import ZipFile
+
+from openerp import fields, workflow
+from openerp.exceptions import Warning as UserError
 from openerp.tests.common import TransactionCase
 from openerp.modules.module import get_module_resource
 from openerp.tools import float_compare
 
+from ..models.account_bank_statement_import_job import JOB_LOCK
+from ..models.account_invoice import normalize_bba
+from .coda_generator import generate_coda
+
 
 class TestCodaFile(TransactionCase):
     """Tests for import bank statement coda file format
@@ -97,6 +112,62 @@ class TestCodaFile(TransactionCase):
         with self.assertRaises(Exception):
             self.bank_statement_import.import_file()
 
+    def test_coda_file_import_twice_hash(self):
+        self.bank_statement_import.import_file()
+        bank_st_record = self.bank_statement_model.search([
+            ('name', '=', 'TBNK/2012/135')])
+        imported_file = self.env['account.bank.statement.import.file'].search(
+            [('statement_ids', '=', bank_st_record.id)])
+        self.assertEqual(imported_file.journal_id, bank_st_record.journal_id)
+        with self.assertRaises(Exception) as error:
+            self.bank_statement_import.import_file()
+        self.assertIn('TBNK/2012/135', error.exception.message)
+        # the file can be imported again once its statement is deleted
+        bank_st_record.unlink()
+        self.bank_statement_import.import_file()
+        self.assertTrue(self.bank_statement_model.search([
+            ('name', '=', 'TBNK/2012/135')]))
+
+    def test_coda_file_native_decoder(self):
+        self.bank_statement_import.with_context(
+            coda_decoder='native').import_file()
+        bank_st_record = self.bank_statement_model.search([
+            ('name', '=', 'TBNK/2012/135')])[0]
+        self.assertEqual(len(bank_st_record.line_ids), 7)
+        self.assertEqual(
+            bank_st_record.line_ids[1].name, '+++240/2838/42818+++')
+
+    def test_coda_file_globalisation_details(self):
+        data_file = generate_coda(
+            statements=1, movements=1, globalisations=2,
+            globalisation_details=2, seed=1)
+        st_vals = self.statement_import_model._parse_file(data_file)[0]
+        transactions = st_vals['transactions']
+        self.assertEqual(
+            [t['sequence'] for t in transactions], range(5))
+        self.assertEqual(
+            [t['name'] for t in transactions[1:]],
+            ['GLOBALISATION 001 0002'] * 2 + ['GLOBALISATION 001 0003'] * 2)
+
+    def test_coda_file_nested_globalisations(self):
+        """The details of nested globalisations sharing a movement reference
+        are named after the last globalisation of this reference"""
+        records = generate_coda(
+            statements=1, movements=1, globalisations=1,
+            globalisation_details=4, seed=1).split('\r\n')
+        for index, record in enumerate(records):
+            if record[:10] in ('2100020001', '2100020003'):
+                # the detail is a globalisation of the next detail
+                records[index] = record[:53] + '2' + record[54:62] + \
+                    ('NESTED %s' % record[9]).ljust(53) + record[115:]
+        data_file = '\r\n'.join(records)
+        for decoder in ('pycoda', 'native'):
+            st_vals = self.statement_import_model.with_context(
+                coda_decoder=decoder)._parse_file(data_file)[0]
+            self.assertEqual(
+                [t['name'] for t in st_vals['transactions'][1:]],
+                ['GLOBALISATION 001 0002', 'NESTED 3', 'NESTED 3'])
+
     def test_coda_file_wrong_journal(self):
         """ The demo account used by the CODA file is linked to the
         demo bank_journal """
@@ -105,3 +176,362 @@ class TestCodaFile(TransactionCase):
                 journal_id=self.ref('account.check_journal'))
         with self.assertRaises(Exception):
             bank_statement_import.import_file()
+
+    def test_coda_file_streaming(self):
+        data_file = self.coda_file.decode('base64')
+        stmts_vals = self.statement_import_model._iter_parse_file(
+            data_file * 2)
+        st_vals = next(stmts_vals)
+        self.assertEqual(st_vals['account_number'], 'BE46737018594236')
+        self.assertEqual(st_vals['currency_code'], 'EUR')
+        self.assertEqual(len(st_vals['transactions']), 7)
+        self.assertEqual(len(list(stmts_vals)), 1)
+
+    def test_coda_file_bulk_lines(self):
+        self.bank_statement_import.import_file()
+        bank_st_record = self.bank_statement_model.search([
+            ('name', '=', 'TBNK/2012/135')])[0]
+        self.assertEqual(len(bank_st_record.line_ids), 7)
+        self.assertEqual(
+            bank_st_record.line_ids.mapped('sequence'), range(1, 8))
+        self.assertEqual(
+            bank_st_record.line_ids.mapped('journal_id'),
+            bank_st_record.journal_id)
+        self.assertEqual(
+            float_compare(
+                bank_st_record.balance_end,
+                sum(bank_st_record.line_ids.mapped('amount')) +
+                bank_st_record.balance_start,
+                precision_digits=2),
+            0)
+
+    def test_coda_file_imported_unique_ids(self):
+        self.bank_statement_import.import_file()
+        bank_st_record = self.bank_statement_model.search([
+            ('name', '=', 'TBNK/2012/135')])[0]
+        unique_ids = bank_st_record.line_ids.mapped('unique_import_id')
+        imported_ids = self.statement_import_model._get_imported_unique_ids(
+            unique_ids + ['BE46737018594236-unknown'])
+        self.assertEqual(imported_ids, set(unique_ids))
+
+    def test_coda_archive_import(self):
+        data_file = self.coda_file.decode('base64')
+        archive = StringIO()
+        with ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('coda1.txt', data_file)
+            zip_file.writestr('coda2.txt', data_file)
+        # a job is created for each file
+        statement_ids, notifications = \
+            self.statement_import_model._import_file(archive.getvalue())
+        self.assertEqual(statement_ids, [])
+        job_model = self.env['account.bank.statement.import.job']
+        jobs = job_model.browse(notifications[0]['details']['ids'])
+        self.assertEqual(jobs.mapped('filename'), ['coda1.txt', 'coda2.txt'])
+        self.assertEqual(set(jobs.mapped('state')), set(['pending']))
+        job_model.run_pending_jobs()
+        jobs.invalidate_cache()
+        self.assertEqual(jobs.mapped('state'), ['done', 'failed'])
+        self.assertEqual(jobs[0].statement_ids.name, 'TBNK/2012/135')
+        self.assertTrue(jobs[1].result,
+                        'The file already imported should be reported')
+        # the wizard opens the jobs of the files
+        self.bank_statement_import.data_file = \
+            archive.getvalue().encode('base64')
+        action = self.bank_statement_import.import_file()
+        self.assertEqual(
+            action['res_model'], 'account.bank.statement.import.job')
+        self.assertEqual(len(job_model.search(action['domain'])), 2)
+
+    def test_coda_file_import_in_background(self):
+        self.bank_statement_import.run_in_background = True
+        action = self.bank_statement_import.import_file()
+        self.assertEqual(
+            action['res_model'], 'account.bank.statement.import.job')
+        job = self.env['account.bank.statement.import.job'].browse(
+            action['res_id'])
+        self.assertEqual(job.state, 'pending')
+        self.assertFalse(self.bank_statement_model.search([
+            ('name', '=', 'TBNK/2012/135')]))
+        job.run_pending_jobs()
+        job.invalidate_cache()
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.statement_count, 1)
+        self.assertEqual(job.statement_ids.name, 'TBNK/2012/135')
+
+    def test_coda_file_import_job_data_file(self):
+        self.bank_statement_import.run_in_background = True
+        action = self.bank_statement_import.import_file()
+        job = self.env['account.bank.statement.import.job'].browse(
+            action['res_id'])
+        self.assertTrue(job.attachment_id)
+        self.assertEqual(job.data_file.decode('base64'),
+                         self.coda_file.decode('base64'))
+        with job._open_data_file() as data_file:
+            self.assertEqual(data_file[:], self.coda_file.decode('base64'))
+            statement_ids, notifications = \
+                self.statement_import_model._import_file(data_file)
+        self.assertEqual(
+            self.bank_statement_model.browse(statement_ids).name,
+            'TBNK/2012/135')
+        attachment = job.attachment_id
+        job.unlink()
+        self.assertFalse(attachment.exists())
+
+    def test_coda_file_import_in_background_failed(self):
+        self.bank_statement_import.import_file()
+        self.bank_statement_import.run_in_background = True
+        action = self.bank_statement_import.import_file()
+        job = self.env['account.bank.statement.import.job'].browse(
+            action['res_id'])
+        job._run()
+        job.invalidate_cache()
+        self.assertEqual(job.state, 'failed')
+        self.assertTrue(job.result)
+
+    def test_coda_file_import_job_interrupted(self):
+        self.bank_statement_import.run_in_background = True
+        action = self.bank_statement_import.import_file()
+        job = self.env['account.bank.statement.import.job'].browse(
+            action['res_id'])
+        job.write({'state': 'running', 'date_start': fields.Datetime.now()})
+        # a worker running the job holds its lock
+        lock = (JOB_LOCK, job.id)
+        with closing(self.registry.cursor()) as cr:
+            cr.execute("SELECT pg_advisory_lock(%s, %s)", lock)
+            job.action_retry()
+            job.invalidate_cache()
+            self.assertEqual(job.state, 'running')
+            job.run_pending_jobs()
+            job.invalidate_cache()
+            self.assertEqual(job.state, 'running')
+            cr.execute("SELECT pg_advisory_unlock(%s, %s)", lock)
+        # the worker running the job was killed
+        job.run_pending_jobs()
+        job.invalidate_cache()
+        self.assertEqual(job.state, 'failed')
+        job.action_retry()
+        job.run_pending_jobs()
+        job.invalidate_cache()
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.statement_ids.name, 'TBNK/2012/135')
+
+    def test_coda_file_import_job_run_now(self):
+        self.bank_statement_import.run_in_background = True
+        action = self.bank_statement_import.import_file()
+        job = self.env['account.bank.statement.import.job'].browse(
+            action['res_id'])
+        cron = self.env.ref('account_bank_statement_import_coda.'
+                            'ir_cron_bank_statement_import_job')
+        cron.nextcall = '2100-01-01 00:00:00'
+        # the job is run by the cron, not in the request
+        job.action_run()
+        self.assertEqual(job.state, 'pending')
+        self.assertLess(cron.nextcall, '2100-01-01 00:00:00')
+
+    def test_coda_file_import_job_user(self):
+        user = self.env['res.users'].create({
+            'name': 'Accountant',
+            'login': 'coda_accountant',
+            'groups_id': [(6, 0, [
+                self.env.ref('account.group_account_user').id])],
+        })
+        job_model = self.env['account.bank.statement.import.job'].sudo(
+            user.id)
+        with self.assertRaises(UserError):
+            job_model.create({
+                'name': 'coda',
+                'data_file': self.coda_file,
+                'user_id': self.env.ref('base.user_root').id,
+            })
+        job = job_model.create({'name': 'coda', 'data_file': self.coda_file})
+        self.assertEqual(job.user_id, user)
+        with self.assertRaises(UserError):
+            job.user_id = self.env.ref('base.user_root')
+
+    def test_coda_file_import_resume(self):
+        data_file = generate_coda(statements=3, movements=5, seed=1)
+        job = self.env['account.bank.statement.import.job'].create({
+            'name': 'coda',
+            'data_file': data_file.encode('base64'),
+            'commit_batch': 1,
+        })
+        import_model = self.env['account.bank.statement.import']
+        imported = []
+
+        def _import_statement(self, stmt_vals):
+            # the import fails after its first committed statement
+            if len(imported) == 1:
+                raise UserError('Interrupted import')
+            imported.append(stmt_vals['name'])
+            return _import_statement.origin(self, stmt_vals)
+
+        import_model._patch_method('_import_statement', _import_statement)
+        try:
+            job._run()
+        finally:
+            import_model._revert_method('_import_statement')
+        job.invalidate_cache()
+        self.assertEqual(job.state, 'failed')
+        self.assertEqual(job.result, 'Interrupted import')
+        checkpoint = self.env[
+            'account.bank.statement.import.checkpoint'].search([
+                ('file_hash', '=', hashlib.sha1(data_file).hexdigest())])
+        self.assertEqual(checkpoint.statement_count, 1)
+        self.assertEqual(checkpoint.last_statement, 'TBNK/2012/001')
+        statements = self.bank_statement_model.search([
+            ('name', 'like', 'TBNK/2012/00%')])
+        self.assertEqual(statements.mapped('name'), ['TBNK/2012/001'])
+        job.action_retry()
+        job.run_pending_jobs()
+        job.invalidate_cache()
+        self.assertEqual(job.state, 'done')
+        # the statements are imported once, none is missing
+        statements = self.bank_statement_model.search([
+            ('name', 'like', 'TBNK/2012/00%')], order='name')
+        self.assertEqual(
+            statements.mapped('name'),
+            ['TBNK/2012/001', 'TBNK/2012/002', 'TBNK/2012/003'])
+        self.assertEqual(job.statement_ids, statements)
+        self.assertEqual(
+            len(statements.mapped('line_ids')),
+            len(set(statements.mapped('line_ids.unique_import_id'))))
+        self.assertFalse(checkpoint.exists())
+
+    def test_coda_file_partner_bank_index(self):
+        partner = self.env['res.partner'].create({'name': 'PARTNER 2'})
+        self.env['res.partner.bank'].create({
+            'state': 'bank',
+            'acc_number': 'BE61 3101 2698 5517',
+            'partner_id': partner.id,
+        })
+        self.bank_statement_import.import_file()
+        bank_st_record = self.bank_statement_model.search([
+            ('name', '=', 'TBNK/2012/135')])[0]
+        self.assertEqual(bank_st_record.line_ids[1].partner_id, partner)
+        self.assertFalse(bank_st_record.line_ids[0].partner_id)
+
+    def test_coda_file_invoice_proposal(self):
+        partner = self.env['res.partner'].create({'name': 'Customer'})
+        invoice = self.env['account.invoice'].create({
+            'partner_id': partner.id,
+            'account_id': self.ref('account.a_recv'),
+            'type': 'out_invoice',
+            'date_invoice': '2012-01-05',
+            'reference_type': 'none',
+            'reference': '+++240/2838/42818+++',
+            'invoice_line': [(0, 0, {
+                'name': 'Service',
+                'account_id': self.ref('account.a_sale'),
+                'price_unit': 3044.45,
+                'quantity': 1,
+            })],
+        })
+        workflow.trg_validate(
+            self.uid, 'account.invoice', invoice.id, 'invoice_open', self.cr)
+        self.bank_statement_import.import_file()
+        bank_st_record = self.bank_statement_model.search([
+            ('name', '=', 'TBNK/2012/135')])[0]
+        self.assertEqual(bank_st_record.line_ids[1].invoice_id, invoice)
+        self.assertEqual(bank_st_record.line_ids[1].partner_id, partner)
+        self.assertFalse(bank_st_record.line_ids[0].invoice_id)
+        # the receivable move line of the invoice is proposed
+        st_line = bank_st_record.line_ids[1]
+        proposition = st_line.get_reconciliation_proposition(st_line)
+        receivable = invoice.move_id.line_id.filtered(
+            lambda l: l.account_id == invoice.account_id)
+        self.assertEqual([l['id'] for l in proposition], receivable.ids)
+
+    def test_normalize_bba(self):
+        self.assertEqual(
+            normalize_bba('+++240/2838/42818+++'), '240283842818')
+        self.assertEqual(
+            normalize_bba('***240/2838/42818***'), '240283842818')
+        # wrong check digits
+        self.assertIsNone(normalize_bba('+++240/2838/42817+++'))
+        # free text having the digits of a structured communication
+        self.assertIsNone(normalize_bba('Order 2402838428 18'))
+        self.assertIsNone(normalize_bba('240/2838/42818'))
+        self.assertIsNone(normalize_bba(False))
+
+    def test_coda_file_import_profile(self):
+        self.bank_statement_import.run_in_background = True
+        self.bank_statement_import.data_file = generate_coda(
+            statements=2, movements=4, globalisations=1, informations=2,
+            seed=1).encode('base64')
+        action = self.bank_statement_import.import_file()
+        job = self.env['account.bank.statement.import.job'].browse(
+            action['res_id'])
+        job.with_context(coda_profile_capture=True)._run()
+        job.invalidate_cache()
+        self.assertEqual(job.state, 'done')
+        profile = json.loads(job.profile.split('\n\n')[0])
+        self.assertEqual(profile['counters'], {
+            'statements': 2,
+            'movements': 2 * 8,
+            'globalisations': 2,
+            'informations': 2 * 2,
+            'transactions': 2 * 7,
+            'ignored_transactions': 0,
+        })
+        for phase in ('decode', 'parse', 'statement_vals',
+                      'complete_statement', 'create_statement'):
+            self.assertIn(phase, profile['phases'])
+        self.assertEqual(profile['phases']['parse']['calls'], 2)
+        self.assertIn('cumulative', job.profile)
+
+    def test_coda_file_import_profile_notification(self):
+        action = self.bank_statement_import.with_context(
+            coda_profile_capture=True).import_file()
+        self.assertTrue(any(
+            n['type'] == 'info' for n in action['context']['notifications']))
+
+    def test_coda_drop_folder(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        data_file = self.coda_file.decode('base64')
+        with open(os.path.join(path, 'coda.txt'), 'wb') as coda_file:
+            coda_file.write(data_file)
+        with open(os.path.join(path, 'coda2.txt.part'), 'wb') as coda_file:
+            coda_file.write(data_file[:100])
+        folder = self.env['account.bank.statement.import.folder'].create({
+            'name': 'CODA',
+            'path': path,
+        })
+        # the file may still be written
+        folder.run_drop_folders()
+        self.assertFalse(folder.job_ids)
+        folder.min_age = 0
+        folder.run_drop_folders()
+        self.assertEqual(folder.job_ids.state, 'done')
+        self.assertEqual(folder.job_ids.statement_ids.name, 'TBNK/2012/135')
+        # the file is copied to the filestore
+        self.assertEqual(folder.job_ids.data_file.decode('base64'), data_file)
+        self.assertFalse(folder.job_ids.file_path)
+        self.assertEqual(sorted(os.listdir(path)),
+                         ['coda2.txt.part', 'processed', 'processing'])
+        self.assertFalse(os.listdir(os.path.join(path, 'processing')))
+        self.assertIsNone(folder._claim_file(os.path.join(path, 'coda.txt')))
+        self.assertEqual(
+            os.listdir(os.path.join(path, 'processed')), ['coda.txt'])
+        # the same file dropped again is moved to the failed directory
+        with open(os.path.join(path, 'coda.txt'), 'wb') as coda_file:
+            coda_file.write(data_file)
+        folder.run_drop_folders()
+        folder.invalidate_cache()
+        self.assertEqual(
+            sorted(folder.job_ids.mapped('state')), ['done', 'failed'])
+        self.assertEqual(
+            os.listdir(os.path.join(path, 'failed')), ['coda.txt'])
+        # a file claimed by an interrupted run is imported by the next run
+        with open(os.path.join(path, 'processing',
+                               '20120101000000000000-coda3.txt'),
+                  'wb') as coda_file:
+            coda_file.write(generate_coda(movements=2, seed=2))
+        folder.run_drop_folders()
+        folder.invalidate_cache()
+        job = folder.job_ids.filtered(lambda j: j.filename == 'coda3.txt')
+        self.assertEqual(job.state, 'done')
+        self.assertFalse(os.listdir(os.path.join(path, 'processing')))
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(path, 'processed'))),
+            ['coda.txt', 'coda3.txt'])
@@ -4,13 +4,22 @@
 
 import re
 import datetime
+import hashlib
+import itertools
 import logging
+from StringIO import StringIO
+from zipfile import ZipFile, BadZipfile
 from dateutil import parser as date_parser
 
-from openerp import api, models
+from openerp import api, fields, models
 from openerp.tools.translate import _
 from openerp.exceptions import Warning as UserError
 
+from ..coda_decoder import CodaDecoder
+from ..import_profile import ImportProfile, NULL_PROFILE
+from ..models.account_invoice import normalize_bba
+from ..models.res_partner_bank import normalize_acc_number
+
 _logger = logging.getLogger(__name__)
 
 try:
@@ -23,10 +32,104 @@ except ImportError:
         "`https://pypi.python.org/pypi/pycoda`.")
     Parser = None
 
+# Number of statement lines inserted by a single query when creating the
+# lines of a CODA statement
+LINE_BATCH_SIZE = 500
+
+# Modules whose create of the statement lines only checks the values, as
+# _create_bank_statement_lines does; the lines are created with the ORM
+# when another module overrides it
+LINE_CREATE_MODULES = ('account',)
+
+# System parameter enabling the cProfile capture of the imports
+PROFILE_CAPTURE_PARAM = 'account_bank_statement_import_coda.profile_capture'
+
+# System parameter selecting the decoder of the CODA files: 'pycoda'
+# (default) or 'native' for the built-in CodaDecoder
+DECODER_PARAM = 'account_bank_statement_import_coda.decoder'
+
 
 class AccountBankStatementImport(models.TransientModel):
     _inherit = 'account.bank.statement.import'
 
+    run_in_background = fields.Boolean(
+        'Import in background',
+        help='The file is imported later by a background job, which '
+             'avoids the time limit of the request for large files. The '
+             'progress and the result of the import are shown on the job.')
+
+    @api.multi
+    def import_file(self):
+        self.ensure_one()
+        # a ZIP archive starts with PK\x03\x04, UEsDB in base64
+        coda_files = (self.data_file or '').startswith('UEsDB') and \
+            self._get_coda_archive_files(self.data_file.decode('base64'))
+        if coda_files:
+            jobs = self._create_coda_archive_jobs(coda_files)
+            return {
+                'name': _('Bank Statement Import Jobs'),
+                'type': 'ir.actions.act_window',
+                'res_model': 'account.bank.statement.import.job',
+                'domain': [('id', 'in', jobs.ids)],
+                'view_mode': 'tree,form',
+                'view_type': 'form',
+                'target': 'current',
+            }
+        if not self.run_in_background:
+            profile = self._new_import_profile()
+            # the file is decoded by import_file, the decode phase ends
+            # when _import_file is called
+            profile.begin('decode')
+            with profile.capture():
+                action = super(AccountBankStatementImport, self.with_context(
+                    coda_import_profile=profile)).import_file()
+            if profile.counters:
+                self._log_import_profile(profile)
+                if profile.capture_stats:
+                    action['context']['notifications'].append({
+                        'type': 'info',
+                        'message': _('Import profile:\n%s') %
+                        profile.report(),
+                    })
+            return action
+        job = self.env['account.bank.statement.import.job'].create({
+            'name': self.filename or fields.Datetime.now(),
+            'data_file': self.data_file,
+            'filename': self.filename,
+            'journal_id': self.journal_id.id,
+        })
+        return {
+            'name': _('Bank Statement Import Job'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.bank.statement.import.job',
+            'res_id': job.id,
+            'view_mode': 'form',
+            'view_type': 'form',
+            'target': 'current',
+        }
+
+    @api.model
+    def _new_import_profile(self):
+        """Return the profile of a new import. The import is profiled by
+        cProfile when the coda_profile_capture context key or the system
+        parameter account_bank_statement_import_coda.profile_capture is
+        set."""
+        capture = self.env.context.get('coda_profile_capture') or \
+            self.env['ir.config_parameter'].sudo().get_param(
+                PROFILE_CAPTURE_PARAM) in ('1', 'True')
+        return ImportProfile(capture=capture)
+
+    @api.model
+    def _get_import_profile(self):
+        return self.env.context.get('coda_import_profile') or NULL_PROFILE
+
+    @api.model
+    def _log_import_profile(self, profile):
+        _logger.info('CODA import profile: %s', profile.to_json())
+        if profile.capture_stats:
+            _logger.info('CODA import cProfile statistics:\n%s',
+                         profile.capture_stats)
+
     def _check_coda(self, data_file):
         if Parser is None:
             return False
@@ -42,24 +145,206 @@ class AccountBankStatementImport(models.TransientModel):
         if not self._check_coda(data_file):
             return super(AccountBankStatementImport, self)._parse_file(
                 data_file)
-        vals_bank_statements = []
-        try:
-            statements = Parser().parse(data_file)
-            for statement in statements:
-                vals_bank_statements.append(
-                    self.get_st_vals(statement))
-        except Exception, e:
-            _logger.exception('Error when parsing coda file')
+        return list(self._iter_parse_file(data_file))
+
+    @api.model
+    def _import_file(self, data_file):
+        """Import the statements of the file. A CODA file can be given as
+        a buffer like a read-only memory map, which is read one statement at
+        a time."""
+        self._get_import_profile().end('decode')
+        coda_files = self._get_coda_archive_files(data_file)
+        if coda_files:
+            return self._import_coda_archive(coda_files)
+        if not self._check_coda(data_file):
+            if not isinstance(data_file, basestring):
+                data_file = data_file[:]
+            return super(AccountBankStatementImport, self)._import_file(
+                data_file)
+        # CODA statements are imported as soon as they are parsed, so only
+        # the statement being imported is kept in memory.
+        self = self.with_context(coda_import=True)
+        # exact uploads of an imported file are rejected before parsing
+        file_hash = hashlib.sha1(data_file).hexdigest()
+        file_model = self.env['account.bank.statement.import.file']
+        imported_statements = file_model._get_imported_statements(
+            file_hash, self.env.context.get('journal_id') or
+            self.journal_id.id)
+        if imported_statements:
             raise UserError(
-                _("The following problem occurred during import. "
-                  "The file might not be valid.\n\n %s" % e.message))
+                _('You have already imported that file in the statements '
+                  '%s.') % ', '.join(imported_statements.mapped('name')))
+        job_id = self.env.context.get('bank_statement_import_job_id')
+        job_model = self.env['account.bank.statement.import.job']
+        # with coda_commit_batch, the import is committed every
+        # coda_commit_batch statements and resumes from the last commit
+        commit_batch = self.env.context.get('coda_commit_batch')
+        checkpoint = commit_batch and self._get_import_checkpoint(file_hash)
+        statement_ids = checkpoint and checkpoint.statement_ids.ids or []
+        statement_count = checkpoint and checkpoint.statement_count or 0
+        notifications = []
+        has_statement = has_transaction = bool(statement_count)
+        for stmt_vals in self._iter_parse_file(data_file,
+                                               skip=statement_count):
+            has_statement = True
+            has_transaction = has_transaction or bool(
+                stmt_vals.get('transactions'))
+            statement_id, new_notifications = self._import_statement(
+                stmt_vals)
+            statement_count += 1
+            if statement_id:
+                statement_ids.append(statement_id)
+                if job_id:
+                    job_model.browse(job_id)._set_progress(
+                        len(statement_ids))
+            notifications.extend(new_notifications)
+            if checkpoint and not statement_count % commit_batch:
+                checkpoint.write({
+                    'statement_count': statement_count,
+                    'last_statement': stmt_vals.get('name'),
+                    'statement_ids': [(6, 0, statement_ids)],
+                })
+                job_model._commit()
+        if not has_statement:
+            raise UserError(_('This file doesn\'t contain any statement.'))
+        if not has_transaction:
+            raise UserError(_('This file doesn\'t contain any transaction.'))
+        if not statement_ids:
+            raise UserError(_('You have already imported that file.'))
+        file_model._register(
+            file_hash, self.env['account.bank.statement'].browse(
+                statement_ids), self.env.context.get('filename'))
+        if checkpoint:
+            checkpoint.unlink()
+        return statement_ids, notifications
+
+    @api.model
+    def _get_import_checkpoint(self, file_hash):
+        """Return the checkpoint of a previous import of the file, or a new
+        one. The new checkpoint is committed so it can be found after a
+        failure."""
+        checkpoint_model = self.env['account.bank.statement.import.checkpoint']
+        checkpoint = checkpoint_model.search([('file_hash', '=', file_hash)])
+        if not checkpoint:
+            checkpoint = checkpoint_model.create({'file_hash': file_hash})
+            self.env['account.bank.statement.import.job']._commit()
+        return checkpoint
+
+    def _get_coda_archive_files(self, data_file):
+        """Return the list of (filename, content) of the files of a ZIP
+        archive if all of them are CODA files, None otherwise.
+        """
+        if data_file[:2] != 'PK':
+            return None
+        try:
+            with ZipFile(StringIO(data_file[:]), 'r') as archive:
+                files = [(name, archive.read(name))
+                         for name in archive.namelist()
+                         if not name.endswith('/')]
+        except BadZipfile:
+            return None
+        if not files or not all(self._check_coda(f[1]) for f in files):
+            return None
+        return files
+
+    @api.model
+    def _import_coda_archive(self, files):
+        """Import the CODA files of an archive with a background job per
+        file. Return no statement and a notification listing the jobs.
+        """
+        jobs = self._create_coda_archive_jobs(files)
+        return [], [{
+            'type': 'info',
+            'message': _('The %d files of the archive will be imported by '
+                         'background jobs.') % len(jobs),
+            'details': {
+                'name': _('Bank Statement Import Jobs'),
+                'model': 'account.bank.statement.import.job',
+                'ids': jobs.ids,
+            },
+        }]
+
+    @api.model
+    def _create_coda_archive_jobs(self, files):
+        """Create a background job per CODA file of an archive, in the
+        journal of the wizard or of the account number of its statements.
+        The jobs are run by the cron workers, each one on its own cursor, so
+        that the files are imported in parallel by concurrent workers and a
+        file that fails to import does not prevent the import of the others.
+        """
+        job_model = self.env['account.bank.statement.import.job']
+        journal_id = self.env.context.get('journal_id') or \
+            self.journal_id.id
+        jobs = job_model.browse()
+        for name, data_file in files:
+            jobs |= job_model.create({
+                'name': name,
+                'filename': name,
+                'data_file': data_file.encode('base64'),
+                'journal_id': journal_id,
+            })
+        return jobs
+
+    def _iter_coda_chunks(self, data_file):
+        """Split a CODA file into chunks of records holding one statement
+        each. A statement always starts with a header record (type 0).
+        """
+        starts = [m.start() for m in re.finditer(r'^0', data_file, re.M)]
+        for i, start in enumerate(starts):
+            end = starts[i + 1] if i + 1 < len(starts) else len(data_file)
+            yield data_file[start:end]
 
-        acc_number = None
-        currency = None
-        if statements:
-            acc_number = statements[0].acc_number
-            currency = statement.currency
-        return currency, acc_number, vals_bank_statements
+    @api.model
+    def _get_coda_parser(self):
+        """Return the parser of the CODA files, selected by the coda_decoder
+        context key or the system parameter
+        account_bank_statement_import_coda.decoder."""
+        decoder = self.env.context.get('coda_decoder') or \
+            self.env['ir.config_parameter'].sudo().get_param(DECODER_PARAM)
+        if decoder == 'native':
+            return CodaDecoder()
+        return Parser()
+
+    @api.model
+    def _iter_parse_file(self, data_file, skip=0):
+        """Parse the CODA file statement by statement and yield the vals
+        of each statement as soon as it is parsed. The first skip
+        statements are not parsed.
+        """
+        self = self.with_context(
+            coda_note_labels=self._get_st_line_note_labels())
+        profile = self._get_import_profile()
+        parser = self._get_coda_parser()
+        chunks = self._iter_coda_chunks(data_file)
+        for chunk in itertools.islice(chunks, skip, None):
+            try:
+                with profile.phase('parse'):
+                    statements = parser.parse(chunk)
+                vals_bank_statements = []
+                for statement in statements:
+                    with profile.phase('statement_vals'):
+                        vals = self.get_st_vals(statement)
+                    vals.update({
+                        'currency_code': statement.currency,
+                        'account_number': statement.acc_number,
+                    })
+                    vals_bank_statements.append(vals)
+                    self._count_statement_records(profile, statement, vals)
+            except Exception, e:
+                _logger.exception('Error when parsing coda file')
+                raise UserError(
+                    _("The following problem occurred during import. "
+                      "The file might not be valid.\n\n %s" % e.message))
+            for vals in vals_bank_statements:
+                yield vals
+
+    def _count_statement_records(self, profile, statement, vals):
+        profile.count('statements')
+        profile.count('movements', len(statement.movements))
+        profile.count('globalisations', len(statement.movements) -
+                      len(vals['transactions']))
+        profile.count('informations', len(statement.informations))
+        profile.count('transactions', len(vals['transactions']))
 
     def get_st_vals(self, statement):
         """
@@ -98,39 +383,70 @@ class AccountBankStatementImport(models.TransientModel):
                 'name': "%s%s" % (year, statement.paper_seq_number),
             })
 
-        globalisation_dict = dict([
-            (st.ref_move, st) for st in statement.movements
-            if st.type == MovementRecordType.GLOBALISATION])
         information_dict = {}
         # build a dict of information by transaction_ref. The transaction_ref
         # refers to the transaction_ref of a movement record
         for info_line in statement.informations:
-            infos = information_dict.setdefault(info_line.transaction_ref, [])
-            infos.append(info_line)
-
-        for sequence, line in enumerate(
-                filter(lambda l: l.type != MovementRecordType.GLOBALISATION,
-                       statement.movements)):
-            info = self.get_st_line_vals(line,
-                                         globalisation_dict,
-                                         information_dict)
-            info['sequence'] = sequence
-            transactions.append(info)
+            infos = information_dict.get(info_line.transaction_ref)
+            if infos is None:
+                information_dict[info_line.transaction_ref] = [info_line]
+            else:
+                infos.append(info_line)
+
+        # The movements are assembled in a single pass. The movements of a
+        # reference are contiguous: the lines of the current reference are
+        # buffered and emitted when the reference changes, once the last
+        # globalisation of the reference, naming the details of the nested
+        # globalisations sharing this reference, is known.
+        globalisation_dict = {}
+        ref_lines = []
+
+        def emit_ref_lines():
+            for line in ref_lines:
+                info = self.get_st_line_vals(line,
+                                             globalisation_dict,
+                                             information_dict)
+                info['sequence'] = len(transactions)
+                transactions.append(info)
+            del ref_lines[:]
+
+        ref_move = None
+        for line in statement.movements:
+            if line.ref_move != ref_move:
+                emit_ref_lines()
+                ref_move = line.ref_move
+            if line.type == MovementRecordType.GLOBALISATION:
+                globalisation_dict[line.ref_move] = line
+            else:
+                ref_lines.append(line)
+        emit_ref_lines()
         return vals
 
+    def _get_st_line_note_labels(self):
+        """Return the translated prefixes of the parts of a line note.
+        They are computed once per import and given to get_st_line_note
+        through the context.
+        """
+        return (
+            _('Counter Party') + ': ',
+            _('Counter Party Account') + ': ',
+            _('Counter Party Address') + ': ',
+            _('Communication') + ': ',
+        )
+
     def get_st_line_note(self, line, information_dict):
         """This method returns a formatted note from line information
         """
+        counterparty, counterparty_account, counterparty_address, \
+            communication = self.env.context.get('coda_note_labels') or \
+            self._get_st_line_note_labels()
         note = []
         if line.counterparty_name:
-            note.append(_('Counter Party') + ': ' +
-                        line.counterparty_name)
+            note.append(counterparty + line.counterparty_name)
         if line.counterparty_number:
-            note.append(_('Counter Party Account') + ': ' +
-                        line.counterparty_number)
+            note.append(counterparty_account + line.counterparty_number)
         if line.counterparty_address:
-            note.append(_('Counter Party Address') + ': ' +
-                        line.counterparty_address)
+            note.append(counterparty_address + line.counterparty_address)
         infos = information_dict.get(line.transaction_ref, [])
         if line.communication or infos:
             communications = []
@@ -138,8 +454,7 @@ class AccountBankStatementImport(models.TransientModel):
                 communications.append(line.communication)
             for info in infos:
                 communications.append(info.communication)
-            note.append(_('Communication') + ': ' +
-                        " ".join(communications))
+            note.append(communication + " ".join(communications))
         return note and '\n'.join(note) or None
 
     def get_st_line_name(self, line, globalisation_dict):
@@ -188,9 +503,248 @@ class AccountBankStatementImport(models.TransientModel):
 
     @api.model
     def _complete_statement(self, stmts_vals, journal_id, account_number):
-        stmts_vals = super(
-            AccountBankStatementImport, self)._complete_statement(
-                stmts_vals, journal_id, account_number)
-        journal = self.env['account.journal'].browse(journal_id)
-        stmts_vals['name'] = '%s/%s' % (journal.code, stmts_vals['name'])
+        with self._get_import_profile().phase('complete_statement'):
+            if self.env.context.get('coda_import'):
+                self._set_partner_bank_accounts(stmts_vals['transactions'])
+            stmts_vals = super(
+                AccountBankStatementImport, self)._complete_statement(
+                    stmts_vals, journal_id, account_number)
+            if self.env.context.get('coda_import'):
+                self._set_invoice_proposals(stmts_vals['transactions'])
+            journal = self.env['account.journal'].browse(journal_id)
+            stmts_vals['name'] = '%s/%s' % (journal.code, stmts_vals['name'])
         return stmts_vals
+
+    @api.model
+    def _set_partner_bank_accounts(self, transactions):
+        """Set the bank account and the partner of the transactions from
+        their counterparty account number, looking up all the numbers of
+        the statement at once. Missing bank accounts are created once per
+        number.
+        """
+        bank_model = self.env['res.partner.bank']
+        transactions = [
+            line_vals for line_vals in transactions
+            if line_vals.get('account_number') and
+            not line_vals.get('bank_account_id')]
+        index = bank_model._get_normalized_acc_number_index(
+            [line_vals['account_number'] for line_vals in transactions])
+        for line_vals in transactions:
+            acc_number = normalize_acc_number(line_vals['account_number'])
+            bank = index.get(acc_number)
+            if bank is None:
+                bank = index[acc_number] = self._create_bank_account(
+                    line_vals['account_number'])
+                partner_id = False
+            else:
+                partner_id = bank.partner_id.id
+            line_vals['bank_account_id'] = bank.id
+            line_vals['partner_id'] = partner_id
+
+    @api.model
+    def _set_invoice_proposals(self, transactions):
+        """Propose the open invoice whose reference is the structured
+        communication of the transaction, looking up the communications of
+        the statement at once. Incoming amounts are matched with customer
+        invoices, outgoing amounts with supplier invoices. The partner of
+        the invoice is set on transactions without partner.
+        """
+        bbas = [normalize_bba(line_vals['name']) for line_vals in transactions]
+        index = self.env['account.invoice']._get_open_invoice_bba_index(
+            [bba for bba in bbas if bba])
+        for line_vals, bba in zip(transactions, bbas):
+            invoice_type = line_vals['amount'] > 0 and 'out_invoice' or \
+                'in_invoice'
+            invoice = index.get((bba, invoice_type))
+            if invoice:
+                line_vals['invoice_id'] = invoice.id
+                if not line_vals.get('partner_id'):
+                    line_vals['partner_id'] = \
+                        invoice.commercial_partner_id.id
+
+    @api.model
+    def _create_bank_statement(self, stmt_vals):
+        if not self.env.context.get('coda_import'):
+            return super(AccountBankStatementImport,
+                         self)._create_bank_statement(stmt_vals)
+        with self._get_import_profile().phase('create_statement'):
+            return self._create_coda_bank_statement(stmt_vals)
+
+    @api.model
+    def _create_coda_bank_statement(self, stmt_vals):
+        transactions = stmt_vals.pop('transactions')
+        imported_ids = self._get_imported_unique_ids(
+            [l['unique_import_id'] for l in transactions
+             if l.get('unique_import_id')])
+        ignored_line_ids = []
+        filtered_st_lines = []
+        for line_vals in transactions:
+            unique_id = line_vals.get('unique_import_id')
+            if unique_id and unique_id in imported_ids:
+                ignored_line_ids.append(unique_id)
+            else:
+                filtered_st_lines.append(line_vals)
+        statement_id = False
+        notifications = []
+        if filtered_st_lines:
+            statement = self.env['account.bank.statement'].create(stmt_vals)
+            self._create_bank_statement_lines(statement, filtered_st_lines)
+            statement_id = statement.id
+        elif ignored_line_ids:
+            notifications.append({
+                'type': 'warning',
+                'message': _("Statement %s had already been imported and "
+                             "was skipped.") % stmt_vals.get('name'),
+            })
+        notifications += self._get_ignored_notifications(ignored_line_ids)
+        self._get_import_profile().count(
+            'ignored_transactions', len(ignored_line_ids))
+        return statement_id, notifications
+
+    @api.model
+    def _get_imported_unique_ids(self, unique_ids):
+        """Return the subset of the given unique import ids that are already
+        used by a bank statement line, using one query per batch of ids
+        on the index of the unique_import_id constraint.
+        """
+        imported_ids = set()
+        cr = self.env.cr
+        for sub_ids in cr.split_for_in_conditions(set(unique_ids)):
+            cr.execute(
+                "SELECT unique_import_id FROM account_bank_statement_line "
+                "WHERE unique_import_id IN %s", (sub_ids,))
+            imported_ids.update(r[0] for r in cr.fetchall())
+        return imported_ids
+
+    @api.model
+    def _get_ignored_notifications(self, ignored_line_ids):
+        notifications = []
+        num_ignored = len(ignored_line_ids)
+        if num_ignored > 0:
+            bsl_model = self.env['account.bank.statement.line']
+            notifications.append({
+                'type': 'warning',
+                'message':
+                    _("%d transactions had already been imported and "
+                      "were ignored.") % num_ignored
+                    if num_ignored > 1
+                    else _("1 transaction had already been imported and "
+                           "was ignored."),
+                'details': {
+                    'name': _('Already imported items'),
+                    'model': 'account.bank.statement.line',
+                    'ids': bsl_model.search(
+                        [('unique_import_id', 'in', ignored_line_ids)]).ids}
+            })
+        return notifications
+
+    @api.model
+    def _create_bank_statement_lines(self, statement, lines_vals):
+        """Create the lines of a statement with multi-rows INSERT queries
+        and compute the stored fields depending on these lines once for the
+        whole statement instead of once per line.
+        The INSERT queries bypass the create method of the statement lines:
+        the access rights and the constraints are checked here, and the
+        lines are created with the ORM when a module overrides create.
+        The lines vals are the ones returned by get_st_line_vals.
+        """
+        bsl_model = self.env['account.bank.statement.line']
+        if not self._can_insert_statement_lines():
+            lines = bsl_model.browse()
+            for sequence, line_vals in enumerate(lines_vals, 1):
+                vals = dict(line_vals, statement_id=statement.id,
+                            sequence=sequence)
+                vals.pop('account_number', None)
+                lines |= bsl_model.create(vals)
+            return lines
+        bsl_model.check_access_rights('create')
+        columns = bsl_model._columns
+        given = set()
+        for line_vals in lines_vals:
+            given.update(line_vals)
+            # same check as account.bank.statement.line create
+            if line_vals.get('amount_currency') and \
+                    not line_vals.get('amount'):
+                raise UserError(_(
+                    'If "Amount Currency" is specified, then "Amount" must '
+                    'be as well.'))
+        defaults = bsl_model.default_get(
+            [f for f in columns if f not in given])
+        inserted = set()
+        line_ids = []
+        for start in range(0, len(lines_vals), LINE_BATCH_SIZE):
+            rows = []
+            for sequence, line_vals in enumerate(
+                    lines_vals[start:start + LINE_BATCH_SIZE], start + 1):
+                vals = dict(defaults, **line_vals)
+                vals.pop('account_number', None)
+                # same sequence as account.bank.statement create
+                vals.update({
+                    'statement_id': statement.id,
+                    'sequence': sequence,
+                })
+                inserted.update(vals)
+                rows.append(vals)
+            line_ids += self._insert_statement_lines(rows)
+        self.env.invalidate_all()
+        cr, uid, context = self.env.args
+        result = bsl_model._store_get_values(cr, uid, line_ids, None, context)
+        result.sort()
+        done = []
+        for __, model_name, ids, fnames in result:
+            if (model_name, ids, fnames) not in done:
+                self.pool[model_name]._store_set_values(
+                    cr, uid, ids, fnames, context)
+                done.append((model_name, ids, fnames))
+        lines = bsl_model.browse(line_ids)
+        lines.check_access_rule('create')
+        fnames = [f for f in inserted if f in columns]
+        lines.modified(fnames)
+        lines.recompute()
+        lines._validate_fields(fnames)
+        return lines
+
+    @api.model
+    def _can_insert_statement_lines(self):
+        """Return whether the statement lines can be inserted with SQL
+        queries, their create method not being overridden by a module
+        other than LINE_CREATE_MODULES."""
+        bsl_model = self.env['account.bank.statement.line']
+        for cls in type(bsl_model).__mro__:
+            if 'create' in vars(cls) and \
+                    cls.__module__.startswith('openerp.addons.') and \
+                    cls._module not in LINE_CREATE_MODULES:
+                return False
+        return True
+
+    @api.model
+    def _insert_statement_lines(self, rows):
+        """Insert the given rows in account_bank_statement_line with a
+        single query and return the ids of the new lines in the same order.
+        """
+        bsl_model = self.env['account.bank.statement.line']
+        columns = bsl_model._columns
+        fnames = sorted(set(
+            f for row in rows for f in row
+            if f in columns and columns[f]._classic_write and
+            f not in models.LOG_ACCESS_COLUMNS))
+        uid = self.env.uid
+        now = fields.Datetime.now()
+        placeholders = []
+        params = []
+        for row in rows:
+            row_placeholders = []
+            for fname in fnames:
+                symbol_c, symbol_f = columns[fname]._symbol_set
+                row_placeholders.append(symbol_c)
+                params.append(symbol_f(row.get(fname, False)))
+            row_placeholders += ['%s', '%s', '%s', '%s']
+            params += [uid, now, uid, now]
+            placeholders.append('(%s)' % ', '.join(row_placeholders))
+        query = 'INSERT INTO account_bank_statement_line (%s) VALUES %s ' \
+            'RETURNING id' % (
+                ', '.join('"%s"' % f for f in fnames + [
+                    'create_uid', 'create_date', 'write_uid', 'write_date']),
+                ', '.join(placeholders))
+        self.env.cr.execute(query, params)
+        return [r[0] for r in self.env.cr.fetchall()]
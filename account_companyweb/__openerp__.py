@@ -22,7 +22,7 @@
 
 {
     "name": "Companyweb (8.0 legacy)",
-    "version": "8.0.1.0.0",
+    "version": "8.0.1.1.0",
     "author": "ACSONE SA/NV,Odoo Community Association (OCA)",
     "category": "Generic Modules/Accounting",
     "website": "http://www.acsone.eu",
@@ -35,7 +35,7 @@
         'account_voucher',
     ],
     'external_dependencies': {
-        'python': ['lxml', 'xlwt', 'xlrd'],
+        'python': ['lxml', 'requests', 'xlwt', 'xlrd'],
     },
     "description": """
 Companyweb - Know who you are dealing with
@@ -56,6 +56,26 @@ Main Features
   credit limit, health barometer, financial informations
   such as turnover or equity capital, and more.
 * Update address and credit limit in your OpenERP database.
+* Update many companies at once from the partner list, or weekly with
+  the scheduled action "Update Companies from Companyweb" (inactive by
+  default). The companies are looked up concurrently, with at most
+  companyweb.workers requests at the same time.
+* Update the companies from a Companyweb XML export, with the Import
+  Companyweb Dump menu next to the Companyweb Report. The export is read
+  incrementally and only the changed values are written. It is imported
+  in background by the scheduled action "Import Companyweb Dumps",
+  committing every 500 companies, and deleted once imported; the result
+  is recorded in the logs (Settings > Technical > Logging). The dumps are
+  parsed without loading their DTD nor resolving their entities.
+* Refresh the companies checked against Companyweb more than
+  companyweb.refresh_days days ago (30 by default), with the daily
+  scheduled action "Refresh Companies from Companyweb", inactive by
+  default as it uses Companyweb credits. The companies never checked are
+  not refreshed; contacts of a company are not refreshed either.
+* Keep the history of the Companyweb information of each company, shown
+  to the accounting managers in the Companyweb tab of the partner form.
+  A company looked up again within the time to live of the cache is
+  shown from its latest snapshot.
 * Generate reports about payment habits of your customers.
 * Access to detailed company information on www.companyweb.be.
 
@@ -64,14 +84,29 @@ Technical information
 This module depends on module account_financial_report_webkit which
 provides an accurate algorithm for open invoices report.
 
+The requests to Companyweb share pooled connections, time out after 5
+seconds to connect and 30 seconds to read, and are retried twice with a
+backoff. After 5 consecutive failures, the requests fail immediately for
+a minute.
+
+Concurrent lookups of the same company, for instance by several
+salespeople opening the same prospect, wait for the first one and share
+its response, so Companyweb is called once. The lookups waiting in the
+same server process get the response directly, the other ones read it
+from the cache: with several worker processes, the cache must be enabled
+(companyweb.cache_ttl not 0) for them to share it.
+
 Contributors
 ------------
 * Stéphane Bidoul <stephane.bidoul@acsone.eu>
 * Adrien Peiffer <adrien.peiffer@acsone.eu>
 """,
     "data": [
+        "security/ir.model.access.csv",
         "wizard/account_companyweb_report_wizard_view.xml",
         "wizard/account_companyweb_wizard_view.xml",
+        "wizard/account_companyweb_enrich_wizard_view.xml",
+        "wizard/account_companyweb_import_wizard_view.xml",
         "view/res_config_view.xml",
         "view/res_partner_view.xml",
     ],
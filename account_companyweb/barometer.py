@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+##############################################################################
+#
+#    Copyright (c) 2014 Acsone SA/NV (http://www.acsone.eu)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+""" Store of the Companyweb health barometer images.
+
+Only a few distinct barometer images exist (neg-XX, pos-XX, barometer_stop
+and barometer_none). An image is read from the images/barometer directory
+of the module, or from the local store in the data directory of the server,
+where the images missing from the module are downloaded once. The resized
+images are kept in memory, so showing a barometer needs neither a network
+round-trip nor an image resize.
+"""
+
+import logging
+import os
+import re
+import threading
+
+from openerp import tools
+import openerp.modules
+
+from . import http_client
+
+logger = logging.getLogger(__name__)
+
+BAROMETER_URL = 'http://www.companyweb.be/img/barometer/'
+
+BAROMETER_NONE = 'barometer_none.png'
+BAROMETER_STOP = 'barometer_stop.png'
+
+# names of the images, also protecting the paths built from them
+BAROMETER_NAME = re.compile(
+    r'^((neg|pos)-\d{2}|barometer_stop|barometer_none)\.png$')
+
+_images = {}
+_name_locks = {}
+_lock = threading.Lock()
+
+
+def get_barometer_name(score=None, end_of_activity=False):
+    """ Return the name of the barometer image of a Companyweb score """
+    if end_of_activity:
+        return BAROMETER_STOP
+    if not score:
+        return BAROMETER_NONE
+    if score[0] == '-':
+        name = "neg-" + score[1:].zfill(2) + ".png"
+    else:
+        name = "pos-" + score.zfill(2) + ".png"
+    if not BAROMETER_NAME.match(name):
+        logger.warning("Unknown Companyweb score %s", score)
+        return BAROMETER_NONE
+    return name
+
+
+def _get_store_path(name):
+    return os.path.join(
+        tools.config['data_dir'], 'companyweb', 'barometer', name)
+
+
+def _read_barometer(name):
+    """ Return the content of the barometer image, downloading it to the
+        local store if it is neither in the module nor in the store """
+    path = openerp.modules.get_module_resource(
+        'account_companyweb', 'images/barometer', name)
+    if not path:
+        path = _get_store_path(name)
+        if not os.path.exists(path):
+            source = http_client.get(BAROMETER_URL + name)
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # written then renamed so that a concurrent read never sees a
+            # partial image
+            tmp_path = '%s.%s.tmp' % (path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(source)
+            os.rename(tmp_path, path)
+            return source
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _get_name_lock(name):
+    with _lock:
+        return _name_locks.setdefault(name, threading.Lock())
+
+
+def get_barometer_image(name):
+    """ Return the barometer image resized to the medium size, base64
+        encoded """
+    if not BAROMETER_NAME.match(name):
+        raise ValueError("Invalid barometer image %s" % name)
+    image = _images.get(name)
+    if image is not None:
+        return image
+    # a lock per image, so that a download does not block the other images
+    with _get_name_lock(name):
+        image = _images.get(name)
+        if image is not None:
+            return image
+        try:
+            source = _read_barometer(name)
+        except IOError:
+            logger.error("Error loading barometer image %s", name,
+                         exc_info=True)
+            source = None
+        if source is not None:
+            image = _images.setdefault(name, tools.image_resize_image_medium(
+                source.encode('base64')))
+    if image is None:
+        # resolved out of the lock of the missing image
+        if name == BAROMETER_NONE:
+            return False
+        return get_barometer_image(BAROMETER_NONE)
+    return image
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+##############################################################################
+#
+#    Copyright (c) 2014 Acsone SA/NV (http://www.acsone.eu)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+""" Extraction of the Companyweb XML responses
+
+The firm elements are read in a single pass over their children into
+CompanywebFirm records, with typed values. The same extraction serves the
+lookups of one company, the bulk updates and the import of the offline
+dumps of Companyweb, which are read incrementally by iterparse_firms.
+
+The documents are parsed without loading their DTD nor resolving their
+entities, so that an uploaded dump cannot read the files of the server.
+"""
+
+from lxml import etree
+
+_firms = etree.XPath('/Companies/firm')
+
+# options of the parsers, not loading any external resource
+PARSER_OPTIONS = {
+    'resolve_entities': False,
+    'no_network': True,
+    'load_dtd': False,
+}
+
+# tags of the firm and of the balance year, with their attribute and type
+FIRM_FIELDS = {
+    'Name': ('name', unicode),
+    'JurForm': ('jur_form', unicode),
+    'Vat': ('vat', unicode),
+    'Street': ('street', unicode),
+    'Nr': ('nr', unicode),
+    'PostalCode': ('postal_code', unicode),
+    'City': ('city', unicode),
+    'CreditLimit': ('credit_limit', float),
+    'StartDate': ('start_date', unicode),
+    'EndDate': ('end_date', unicode),
+    'VATenabled': ('vat_enabled', lambda v: v == 'True'),
+    'Report': ('report', unicode),
+    'Score': ('score', unicode),
+}
+BALANS_FIELDS = {
+    'Rub10_15': ('equity_capital', float),
+    'Rub9800': ('added_value', float),
+    'Rub70': ('turnover', float),
+    'Rub9904': ('result', float),
+}
+
+
+class CompanywebFirm(object):
+    """ Company of a Companyweb response. The missing values are None,
+        except vat_enabled (False) and warnings (an empty list). """
+
+    __slots__ = (
+        'name', 'jur_form', 'vat', 'street', 'nr', 'postal_code', 'city',
+        'credit_limit', 'start_date', 'end_date', 'vat_enabled', 'report',
+        'score', 'warnings', 'balance_year', 'equity_capital', 'added_value',
+        'turnover', 'result',
+    )
+
+    def __init__(self):
+        for slot in self.__slots__:
+            setattr(self, slot, None)
+        self.vat_enabled = False
+        self.warnings = []
+
+    @property
+    def end_of_activity(self):
+        return bool(self.end_date) and self.end_date != '0'
+
+
+def normalize_vat(vat):
+    """ Return the 10 digits of a Belgian VAT number, as written in a
+        partner (BE 0477.472.701) or by Companyweb (477472701), or None """
+    digits = ''.join(c for c in vat or '' if c.isdigit())
+    if not digits or len(digits) > 10:
+        return None
+    return digits.zfill(10)
+
+
+def _read_fields(firm, element, fields):
+    for child in element:
+        field = fields.get(child.tag)
+        if field is not None and child.text:
+            setattr(firm, field[0], field[1](child.text))
+
+
+def parse_firm(element):
+    """ Return the CompanywebFirm of a firm element """
+    firm = CompanywebFirm()
+    for child in element:
+        tag = child.tag
+        field = FIRM_FIELDS.get(tag)
+        if field is not None:
+            if child.text:
+                setattr(firm, field[0], field[1](child.text))
+        elif tag == 'Warnings':
+            firm.warnings = [w.text for w in child if w.text]
+        elif tag == 'Balans' and firm.balance_year is None and len(child):
+            year = child[0]
+            firm.balance_year = year.get('value')
+            _read_fields(firm, year, BALANS_FIELDS)
+    return firm
+
+
+def parse_xml(text):
+    """ Return the element of a Companyweb XML response """
+    # a parser is not shared, as it must not be used by several threads
+    return etree.fromstring(text, parser=etree.XMLParser(**PARSER_OPTIONS))
+
+
+def parse_response(tree):
+    """ Return the error message, the count and the firms of a parsed
+        Companyweb response """
+    root = tree.getroot() if hasattr(tree, 'getroot') else tree
+    return (root.get('Message'), root.get('Count'),
+            [parse_firm(firm) for firm in _firms(root)])
+
+
+def iterparse_firms(source):
+    """ Yield the CompanywebFirm of a Companyweb XML file, keeping only the
+        current firm in memory """
+    context = etree.iterparse(source, events=('end',), tag='firm',
+                              **PARSER_OPTIONS)
+    for event, element in context:
+        yield parse_firm(element)
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+    del context
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+##############################################################################
+#
+#    Copyright (c) 2014 Acsone SA/NV (http://www.acsone.eu)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+""" HTTP client of the Companyweb services
+
+The requests share pooled keep-alive connections, have connect and read
+timeouts, and are retried a few times with an exponential backoff when the
+connection fails or the service is temporarily unavailable. After
+FAILURE_THRESHOLD consecutive failures, a circuit breaker fails the
+requests to the host immediately for RESET_TIMEOUT seconds, so a degraded
+service does not hold the Odoo workers.
+"""
+
+import logging
+import threading
+import time
+import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# pooled connections per host, at least the number of bulk workers
+POOL_SIZE = 10
+RETRIES = 2
+BACKOFF = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 60
+
+_session = None
+_session_lock = threading.Lock()
+_breakers = {}
+
+
+class CompanywebHTTPError(IOError):
+    pass
+
+
+class CircuitOpenError(CompanywebHTTPError):
+    pass
+
+
+class CircuitBreaker(object):
+    """ Consecutive failures of the requests to a host. The circuit opens
+        at the threshold; once the reset timeout elapsed, one trial
+        request is let through, closing the circuit if it succeeds. """
+
+    def __init__(self, threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # half open: the next failure reopens the circuit
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning("Companyweb circuit opened after %d "
+                                   "failures", self.failures)
+                self.opened_at = time.time()
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE,
+                                      pool_maxsize=POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get_breaker(url):
+    host = urlparse.urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = _breakers.setdefault(host, CircuitBreaker())
+    return breaker
+
+
+def reset_breakers():
+    _breakers.clear()
+
+
+def get(url, params=None, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        retries=RETRIES, backoff=BACKOFF):
+    """ Return the content of the url, raising CompanywebHTTPError (an
+        IOError) when it cannot be read """
+    breaker = get_breaker(url)
+    if not breaker.allow():
+        raise CircuitOpenError("Companyweb is unavailable (%s)" % url)
+    attempt = 0
+    while True:
+        try:
+            response = _get_session().get(url, params=params,
+                                          timeout=timeout)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                breaker.success()
+                return response.content
+            error = "HTTP error %d" % response.status_code
+        except (requests.ConnectionError, requests.Timeout), e:
+            error = str(e)
+        except requests.RequestException, e:
+            # client errors are not retried and do not open the circuit
+            raise CompanywebHTTPError(str(e))
+        breaker.failure()
+        if attempt >= retries or not breaker.allow():
+            raise CompanywebHTTPError(
+                "Error loading %s: %s" % (url, error))
+        logger.info("Retrying %s after %s", url, error)
+        time.sleep(backoff * 2 ** attempt)
+        attempt += 1
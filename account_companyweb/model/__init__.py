@@ -21,4 +21,6 @@
 ##############################################################################
 
 from . import res_config
+from . import companyweb_cache
+from . import companyweb_snapshot
 from . import res_partner
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+##############################################################################
+#
+#    Copyright (c) 2014 Acsone SA/NV (http://www.acsone.eu)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import logging
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from psycopg2 import IntegrityError, OperationalError
+
+import openerp
+from openerp.osv import fields, orm
+from openerp import SUPERUSER_ID
+from openerp.tools import DEFAULT_SERVER_DATETIME_FORMAT, mute_logger
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the writes of the hits counted in memory
+HITS_FLUSH_INTERVAL = 60
+
+# (database, cache id) -> [hits, last access date], not yet written
+_hits = {}
+_hits_lock = threading.Lock()
+_hits_flush_time = [time.time()]
+
+
+class account_companyweb_cache(orm.Model):
+    """ Companyweb responses by VAT number and language, so that a company
+        looked up again within the time to live of the cache is read from
+        the database instead of calling (and paying) Companyweb again """
+
+    _name = 'account.companyweb.cache'
+    _description = 'Companyweb response cache'
+    _rec_name = 'vat_number'
+    _order = 'last_access_date desc'
+
+    _columns = {
+        'vat_number': fields.char('VAT number', required=True, select=True,
+                                  readonly=True),
+        'lang': fields.selection([('default', 'Default'),
+                                  ('fr', 'French'),
+                                  ('nl', 'Dutch')],
+                                 'Language', required=True, readonly=True),
+        'response': fields.text('Response', required=True, readonly=True),
+        'fetch_date': fields.datetime('Fetched on', required=True,
+                                      readonly=True),
+        'last_access_date': fields.datetime('Last access', required=True,
+                                            select=True, readonly=True),
+        'hit_count': fields.integer('Hits', readonly=True),
+        'miss_count': fields.integer('Misses', readonly=True),
+    }
+
+    _sql_constraints = [
+        ('vat_number_lang_uniq', 'unique(vat_number, lang)',
+         'There is already a cached response for this VAT number.'),
+    ]
+
+    def _get_ttl(self, cr, uid, context=None):
+        """ Time to live of the responses, in hours. 0 disables the cache """
+        return int(self.pool['ir.config_parameter'].get_param(
+            cr, SUPERUSER_ID, 'companyweb.cache_ttl', 24) or 0)
+
+    def _get_size(self, cr, uid, context=None):
+        """ Maximum number of cached responses """
+        return int(self.pool['ir.config_parameter'].get_param(
+            cr, SUPERUSER_ID, 'companyweb.cache_size', 10000) or 0)
+
+    def _get_expiry_date(self, cr, uid, context=None):
+        return (datetime.now() - timedelta(
+            hours=self._get_ttl(cr, uid, context=context))).strftime(
+            DEFAULT_SERVER_DATETIME_FORMAT)
+
+    def get_response(self, cr, uid, vat_number, lang, context=None):
+        """ Return the cached response for the VAT number and language if
+            it is younger than the time to live, None otherwise. The read
+            takes no lock: the hit is counted in memory and written later,
+            see _flush_hits. """
+        if not self._get_ttl(cr, uid, context=context):
+            return None
+        cr.execute(
+            "SELECT id, response FROM account_companyweb_cache "
+            "WHERE vat_number = %s AND lang = %s AND fetch_date > %s",
+            (vat_number, lang,
+             self._get_expiry_date(cr, uid, context=context)))
+        row = cr.fetchone()
+        if not row:
+            return None
+        key = (cr.dbname, row[0])
+        with _hits_lock:
+            hits = _hits.setdefault(key, [0, None])
+            hits[0] += 1
+            hits[1] = datetime.now().strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+        self._flush_hits(cr, uid, context=context)
+        return row[1]
+
+    def _flush_hits(self, cr, uid, force=False, context=None):
+        """ Write the hits counted in memory for the database, at most every
+            HITS_FLUSH_INTERVAL seconds, in a separate transaction. The rows
+            locked by another transaction are skipped until the next flush,
+            so the counters are approximate but never block a lookup. """
+        testing = getattr(threading.currentThread(), 'testing', False)
+        if not (force or testing or time.time() >
+                _hits_flush_time[0] + HITS_FLUSH_INTERVAL):
+            return
+        _hits_flush_time[0] = time.time()
+        with _hits_lock:
+            pending = dict((k, v) for k, v in _hits.iteritems()
+                           if k[0] == cr.dbname)
+            for key in pending:
+                del _hits[key]
+        if not pending:
+            return
+        if testing:
+            # the separate transaction would not see the test data
+            self._write_hits(cr, pending)
+            return
+        with closing(openerp.registry(cr.dbname).cursor()) as hits_cr:
+            self._write_hits(hits_cr, pending)
+            hits_cr.commit()
+
+    def _write_hits(self, cr, pending):
+        for key, (hits, last_access_date) in pending.iteritems():
+            try:
+                with cr.savepoint(), mute_logger('openerp.sql_db'):
+                    cr.execute("SELECT id FROM account_companyweb_cache "
+                               "WHERE id = %s FOR UPDATE NOWAIT", (key[1],))
+                    cr.execute(
+                        "UPDATE account_companyweb_cache "
+                        "SET hit_count = hit_count + %s, "
+                        "last_access_date = greatest(last_access_date, %s) "
+                        "WHERE id = %s", (hits, last_access_date, key[1]))
+            except OperationalError:
+                # locked or updated meanwhile: written by the next flush
+                with _hits_lock:
+                    counted = _hits.setdefault(key, [0, None])
+                    counted[0] += hits
+                    counted[1] = max(counted[1], last_access_date)
+
+    def set_response(self, cr, uid, vat_number, lang, response,
+                     context=None):
+        """ Cache a response fetched from Companyweb, counted as a miss.
+            A response cached meanwhile by a concurrent transaction is
+            kept. """
+        if not self._get_ttl(cr, uid, context=context):
+            return
+        try:
+            with cr.savepoint(), mute_logger('openerp.sql_db'):
+                self._set_response(cr, uid, vat_number, lang, response,
+                                   context=context)
+        except (IntegrityError, OperationalError):
+            logger.debug("Companyweb response of %s cached concurrently",
+                         vat_number)
+
+    def _set_response(self, cr, uid, vat_number, lang, response,
+                      context=None):
+        now = datetime.now().strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+        ids = self.search(cr, SUPERUSER_ID, [('vat_number', '=', vat_number),
+                                             ('lang', '=', lang)],
+                          context=context)
+        if ids:
+            # fail at once rather than wait for a transaction updating it
+            cr.execute("SELECT id FROM account_companyweb_cache "
+                       "WHERE id IN %s FOR UPDATE NOWAIT", (tuple(ids),))
+            cache = self.browse(cr, SUPERUSER_ID, ids[0], context=context)
+            self.write(cr, SUPERUSER_ID, ids, {
+                'response': response,
+                'fetch_date': now,
+                'last_access_date': now,
+                'miss_count': cache.miss_count + 1,
+            }, context=context)
+        else:
+            self.create(cr, SUPERUSER_ID, {
+                'vat_number': vat_number,
+                'lang': lang,
+                'response': response,
+                'fetch_date': now,
+                'last_access_date': now,
+                'hit_count': 0,
+                'miss_count': 1,
+            }, context=context)
+            self._evict(cr, uid, context=context)
+
+    def _evict(self, cr, uid, context=None):
+        """ Remove the expired responses and the least recently used ones
+            above the size of the cache """
+        cr.execute(
+            "DELETE FROM account_companyweb_cache WHERE fetch_date <= %s",
+            (self._get_expiry_date(cr, uid, context=context),))
+        cr.execute(
+            "DELETE FROM account_companyweb_cache WHERE id IN ("
+            "SELECT id FROM account_companyweb_cache "
+            "ORDER BY last_access_date DESC, id DESC OFFSET %s)",
+            (self._get_size(cr, uid, context=context),))
+
+    def get_statistics(self, cr, uid, context=None):
+        """ Return the number of cached responses, hits and misses """
+        self._flush_hits(cr, uid, force=True, context=context)
+        cr.execute(
+            "SELECT count(*), coalesce(sum(hit_count), 0), "
+            "coalesce(sum(miss_count), 0) FROM account_companyweb_cache")
+        return cr.fetchone()
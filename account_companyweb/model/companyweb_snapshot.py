@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+##############################################################################
+#
+#    Copyright (c) 2014 Acsone SA/NV (http://www.acsone.eu)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from datetime import datetime
+
+from openerp import SUPERUSER_ID
+from openerp.osv import fields, orm
+from openerp.tools import DEFAULT_SERVER_DATETIME_FORMAT
+
+from ..barometer import get_barometer_image
+
+# Companyweb values of a snapshot
+SNAPSHOT_FIELDS = (
+    'vat_number', 'name', 'jur_form', 'street', 'zip', 'city', 'creditLimit',
+    'startDate', 'endDate', 'barometer', 'warnings', 'url', 'vat_liable',
+    'balance_year', 'equityCapital', 'addedValue', 'turnover', 'result',
+)
+
+
+class account_companyweb_snapshot(orm.Model):
+    """ Companyweb information of a partner, from the first lookup returning
+        these values (create_date) to the last one (date). The barometer is
+        referenced by the name of its image, shared by all the snapshots
+        with the same score. """
+
+    _name = 'account.companyweb.snapshot'
+    _description = 'Companyweb information history'
+    _rec_name = 'date'
+    _order = 'date desc, id desc'
+
+    def _get_image(self, cr, uid, ids, field_name, arg, context=None):
+        res = {}
+        for snapshot in self.browse(cr, uid, ids, context=context):
+            res[snapshot.id] = snapshot.barometer and \
+                get_barometer_image(snapshot.barometer)
+        return res
+
+    _columns = {
+        'partner_id': fields.many2one('res.partner', 'Partner', required=True,
+                                      ondelete='cascade', select=True,
+                                      readonly=True),
+        'date': fields.datetime('Date', required=True, readonly=True),
+        'lang': fields.selection([('default', 'Default'),
+                                  ('fr', 'French'),
+                                  ('nl', 'Dutch')],
+                                 'Language', required=True, readonly=True),
+        'vat_number': fields.char('VAT number', readonly=True),
+        'name': fields.char('Name', readonly=True),
+        'jur_form': fields.char('Juridical Form', readonly=True),
+        'street': fields.char('Address', readonly=True),
+        'zip': fields.char('Postal code', readonly=True),
+        'city': fields.char('City', readonly=True),
+        'creditLimit': fields.float('Credit limit', readonly=True),
+        'startDate': fields.date('Start date', readonly=True),
+        'endDate': fields.date('End date', readonly=True),
+        'barometer': fields.char('Barometer', readonly=True),
+        'image': fields.function(_get_image, type='binary',
+                                 string='Health barometer'),
+        'warnings': fields.text('Warnings', readonly=True),
+        'url': fields.char('Detailed Report', readonly=True),
+        'vat_liable': fields.boolean("Subject to VAT", readonly=True),
+        'balance_year': fields.integer("Balance year", readonly=True),
+        'equityCapital': fields.float('Equity Capital', readonly=True),
+        'addedValue': fields.float('Gross Margin (+/-)', readonly=True),
+        'turnover': fields.float('Turnover', readonly=True),
+        'result': fields.float('Fiscal Year Profit/Loss (+/-)',
+                               readonly=True),
+    }
+
+    def get_recent(self, cr, uid, partner_id, vat_number, lang,
+                   context=None):
+        """ Return the id of the latest snapshot of the partner younger
+            than the time to live of the cache, or False """
+        expiry_date = self.pool['account.companyweb.cache']._get_expiry_date(
+            cr, uid, context=context)
+        ids = self.search(cr, uid, [('partner_id', '=', partner_id),
+                                    ('vat_number', '=', vat_number),
+                                    ('lang', '=', lang),
+                                    ('date', '>', expiry_date)],
+                          limit=1, context=context)
+        return ids and ids[0] or False
+
+    def record(self, cr, uid, partner_ids, values, lang, context=None):
+        """ Record the Companyweb values of the partners. A partner whose
+            latest snapshot has the same values gets its date updated
+            instead of a new snapshot. The new snapshots are inserted by a
+            single query. Return the snapshot ids by partner id. """
+        if not partner_ids:
+            return {}
+        now = datetime.now().strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+        # empty values are stored as NULL
+        row = tuple(values.get(f) or None for f in SNAPSHOT_FIELDS)
+        cr.execute(
+            "SELECT DISTINCT ON (partner_id) partner_id, id, lang, %s "
+            "FROM account_companyweb_snapshot WHERE partner_id IN %%s "
+            "ORDER BY partner_id, date DESC, id DESC"
+            % ", ".join('"%s"' % f for f in SNAPSHOT_FIELDS),
+            (tuple(partner_ids),))
+        snapshot_ids = {}
+        for latest in cr.fetchall():
+            if latest[2] == lang and \
+                    tuple(v or None for v in latest[3:]) == row:
+                snapshot_ids[latest[0]] = latest[1]
+        if snapshot_ids:
+            cr.execute("UPDATE account_companyweb_snapshot SET date = %s "
+                       "WHERE id IN %s",
+                       (now, tuple(snapshot_ids.values())))
+        new_partner_ids = [p for p in partner_ids if p not in snapshot_ids]
+        if new_partner_ids:
+            # a plain insert: the snapshots have no stored computed field
+            columns = ('partner_id', 'date', 'lang', 'create_uid',
+                       'create_date', 'write_uid', 'write_date') + \
+                SNAPSHOT_FIELDS
+            placeholders = "(%s)" % ", ".join(["%s"] * len(columns))
+            cr.execute(
+                "INSERT INTO account_companyweb_snapshot (%s) VALUES %s "
+                "RETURNING partner_id, id" % (
+                    ", ".join('"%s"' % c for c in columns),
+                    ", ".join(cr.mogrify(placeholders, (
+                        p, now, lang, SUPERUSER_ID, now, SUPERUSER_ID,
+                        now) + row) for p in new_partner_ids)))
+            snapshot_ids.update(cr.fetchall())
+        self.invalidate_cache(cr, uid, context=context)
+        return snapshot_ids
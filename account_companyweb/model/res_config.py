@@ -27,6 +27,11 @@ from openerp import SUPERUSER_ID
 _parameters = {
     "companyweb.login": "",
     "companyweb.pswd": "",
+    "companyweb.cache_ttl": "24",
+    "companyweb.cache_size": "10000",
+    "companyweb.url": "http://odm.outcome.be/alacarte_onvat.asp",
+    "companyweb.workers": "4",
+    "companyweb.refresh_days": "30",
 }
 
 
@@ -37,6 +42,17 @@ class account_companyweb_config_settings(orm.TransientModel):
     _columns = {
         'companyweb_login': fields.char('Login', 16),
         'companyweb_pswd': fields.char('Password', 16),
+        'companyweb_cache_ttl': fields.integer(
+            'Cache time to live (hours)',
+            help="Companyweb data of a company is read from the cache during "
+                 "this number of hours after being loaded. 0 disables the "
+                 "cache."),
+        'companyweb_cache_size': fields.integer(
+            'Cache size',
+            help="Maximum number of companies kept in the cache. The least "
+                 "recently used ones are removed first."),
+        'companyweb_cache_statistics': fields.char(
+            'Cache statistics', readonly=True),
     }
 
     def init(self, cr, force=False):
@@ -68,3 +84,29 @@ class account_companyweb_config_settings(orm.TransientModel):
         self.pool['ir.config_parameter'].set_param(
             cr, SUPERUSER_ID, 'companyweb.pswd', config.companyweb_pswd)
         return True
+
+    def get_default_companyweb_cache(self, cr, uid, fields_name,
+                                     context=None):
+        config_parameter_model = self.pool['ir.config_parameter']
+        count, hits, misses = self.pool[
+            'account.companyweb.cache'].get_statistics(
+            cr, uid, context=context)
+        return {
+            'companyweb_cache_ttl': int(config_parameter_model.get_param(
+                cr, SUPERUSER_ID, 'companyweb.cache_ttl', 0) or 0),
+            'companyweb_cache_size': int(config_parameter_model.get_param(
+                cr, SUPERUSER_ID, 'companyweb.cache_size', 0) or 0),
+            'companyweb_cache_statistics':
+                "%d companies, %d hits, %d misses" % (count, hits, misses),
+        }
+
+    def set_default_companyweb_cache(self, cr, uid, ids, context=None):
+        config = self.browse(cr, uid, ids[0], context)
+        config_parameter_model = self.pool['ir.config_parameter']
+        config_parameter_model.set_param(
+            cr, SUPERUSER_ID, 'companyweb.cache_ttl',
+            str(config.companyweb_cache_ttl))
+        config_parameter_model.set_param(
+            cr, SUPERUSER_ID, 'companyweb.cache_size',
+            str(config.companyweb_cache_size))
+        return True
@@ -20,47 +20,261 @@
 #
 ##############################################################################
 
-import urllib
+import base64
 import logging
+import threading
+from cStringIO import StringIO
+from contextlib import closing
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
 
+import requests
 from lxml import etree
 
-from openerp.osv import orm
-from openerp import tools
-import openerp.modules
+from openerp import SUPERUSER_ID
+from openerp.osv import fields, orm
+from openerp.tools import DEFAULT_SERVER_DATETIME_FORMAT
+
+from .. import http_client
+from ..barometer import get_barometer_name
+from ..companyweb_parser import iterparse_firms, normalize_vat, \
+    parse_response, parse_xml
 
 
 logger = logging.getLogger(__name__)
 
+# Number of partners enriched per transaction by the scheduled enrichment
+ENRICH_BATCH_SIZE = 100
+
+# Number of firms of a Companyweb dump imported per batch
+IMPORT_BATCH_SIZE = 500
+
+# res_model of the attachments of the dumps waiting to be imported
+DUMP_RES_MODEL = 'account.companyweb.import.wizard'
+
+# First key of the advisory locks of the Companyweb lookups, the second one
+# being the hash of the VAT number and the language
+LOOKUP_LOCK = 477472701
+
+# (database, VAT number, language) -> lookup in progress in this process,
+# {'waiting': lookups holding or waiting for the lock, 'response': response
+# fetched by one of them}, so that the waiting lookups get the response
+# even when the cache is disabled
+_lookups = {}
+_lookups_lock = threading.Lock()
+
+
+class companyweb_values(dict):
+    """ Values of the Companyweb wizard, readable as attributes like the
+        wizard given to get_update_values """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
 
 class res_partner(orm.Model):
     _inherit = 'res.partner'
 
-    def companyweb_information(self, cr, uid, ids, vat_number, context=None):
-        login = self.pool['ir.config_parameter'].get_param(
-            cr, uid, 'companyweb.login', False)
-        pswd = self.pool['ir.config_parameter'].get_param(
-            cr, uid, 'companyweb.pswd', False)
-        url = "http://odm.outcome.be/alacarte_onvat.asp?login=" + \
-            login + "&pswd=" + pswd + "&vat=" + vat_number
-
-        if context.get('lang', '').startswith('fr'):
-            url = url + "&lang=1"
-        elif context.get('lang', '').startswith('nl'):
-            url = url + "&lang=2"
+    _columns = {
+        'companyweb_date': fields.datetime(
+            'Companyweb check', readonly=True,
+            help="Last time the values of the company were checked against "
+                 "Companyweb."),
+        'companyweb_snapshot_ids': fields.one2many(
+            'account.companyweb.snapshot', 'partner_id',
+            'Companyweb history', readonly=True),
+    }
+
+    def _companyweb_lang(self, cr, uid, context=None):
+        lang = (context or {}).get('lang') or ''
+        if lang.startswith('fr'):
+            return 'fr'
+        elif lang.startswith('nl'):
+            return 'nl'
+        return 'default'
+
+    def _companyweb_request(self, cr, uid, vat_number, lang, context=None):
+        """ Return the url and the parameters of the Companyweb request for
+            the VAT number """
+        config_parameter_model = self.pool['ir.config_parameter']
+        url = config_parameter_model.get_param(
+            cr, uid, 'companyweb.url',
+            'http://odm.outcome.be/alacarte_onvat.asp')
+        params = {
+            'login': config_parameter_model.get_param(
+                cr, uid, 'companyweb.login', False),
+            'pswd': config_parameter_model.get_param(
+                cr, uid, 'companyweb.pswd', False),
+            'vat': vat_number,
+        }
+        if lang == 'fr':
+            params['lang'] = 1
+        elif lang == 'nl':
+            params['lang'] = 2
+        return url, params
 
+    def _companyweb_http_get(self, url, params, vat_number):
         try:
-            p = etree.XMLParser(no_network=False)
-            tree = etree.parse(url, parser=p)
-        except:
-            logging.error("Error parsing companyweb url %s", url,
-                          exc_info=True)
+            return http_client.get(url, params)
+        except http_client.CircuitOpenError:
+            raise orm.except_orm('Warning !',
+                                 "Companyweb is temporarily unavailable.\n"
+                                 "Please retry in a few minutes.")
+        except (http_client.CompanywebHTTPError,
+                requests.RequestException):
+            logger.error("Error loading companyweb url %s for %s", url,
+                         vat_number, exc_info=True)
             raise orm.except_orm('Warning !',
                                  "System error loading Companyweb data.\n"
                                  "Please retry and contact your "
                                  "system administrator if the error persists.")
 
-        message = tree.xpath("/Companies")[0].get("Message")
+    def _companyweb_fetch_all(self, cr, uid, vat_numbers, lang,
+                              context=None):
+        """ Fetch the Companyweb responses of the VAT numbers concurrently,
+            with at most companyweb.workers requests at the same time.
+            Return a list of (vat_number, response, error) """
+        if not vat_numbers:
+            return []
+        requests_params = [
+            (vat_number,) + self._companyweb_request(
+                cr, uid, vat_number, lang, context=context)
+            for vat_number in vat_numbers]
+        workers = int(self.pool['ir.config_parameter'].get_param(
+            cr, uid, 'companyweb.workers', 4) or 1)
+
+        def fetch(request_params):
+            # no database access in the workers
+            vat_number, url, params = request_params
+            try:
+                return vat_number, http_client.get(url, params), None
+            except http_client.CircuitOpenError, e:
+                return vat_number, None, e
+            except Exception, e:
+                logger.error("Error loading companyweb url %s for %s", url,
+                             vat_number, exc_info=True)
+                return vat_number, None, e
+
+        pool = ThreadPool(max(min(workers, len(requests_params)), 1))
+        try:
+            return pool.map(fetch, requests_params)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _companyweb_get_tree(self, cr, uid, vat_number, context=None):
+        """ Return the parsed Companyweb response for the VAT number, from
+            the cache when a response was fetched recently """
+        cache_model = self.pool['account.companyweb.cache']
+        lang = self._companyweb_lang(cr, uid, context=context)
+        response = cache_model.get_response(
+            cr, uid, vat_number, lang, context=context)
+        if response is not None:
+            return self._companyweb_parse(
+                cr, uid, vat_number, lang, response, True, context=context)
+        return self._companyweb_fetch_once(
+            cr, uid, vat_number, lang, context=context)
+
+    def _companyweb_fetch_once(self, cr, uid, vat_number, lang,
+                               context=None):
+        """ Fetch and cache the response for the VAT number in a separate
+            transaction holding an advisory lock on the VAT number, so that
+            concurrent lookups of the same company wait for the first one
+            instead of calling Companyweb again. The lookups of the same
+            process get its response directly, the ones of other processes
+            read it from the cache, if enabled. Return the parsed response.
+            """
+        url, params = self._companyweb_request(
+            cr, uid, vat_number, lang, context=context)
+        if getattr(threading.currentThread(), 'testing', False):
+            # the separate transaction would not see the test data
+            return self._companyweb_fetch_locked(
+                cr, uid, vat_number, lang, url, params, False,
+                context=context)
+        with closing(self.pool.cursor()) as lock_cr:
+            return self._companyweb_fetch_locked(
+                lock_cr, uid, vat_number, lang, url, params, True,
+                context=context)
+
+    def _companyweb_fetch_locked(self, cr, uid, vat_number, lang, url,
+                                 params, commit, context=None):
+        """ Return the parsed response for the VAT number, from the cache or
+            fetched and cached, holding the advisory lock on the VAT number.
+            The transaction is committed when commit is set. """
+        cache_model = self.pool['account.companyweb.cache']
+        key = (cr.dbname, vat_number, lang)
+        with _lookups_lock:
+            lookup = _lookups.setdefault(key, {'waiting': 0,
+                                               'response': None})
+            lookup['waiting'] += 1
+        lock = (LOOKUP_LOCK, '%s-%s' % (vat_number, lang))
+        try:
+            cr.execute("SELECT pg_advisory_lock(%s, hashtext(%s))", lock)
+            try:
+                if commit:
+                    # start a new snapshot, seeing the responses cached while
+                    # waiting for the lock
+                    cr.commit()
+                response = cache_model.get_response(
+                    cr, uid, vat_number, lang, context=context)
+                if response is None:
+                    # fetched by a lookup of this process while waiting
+                    response = lookup['response']
+                cached = response is not None
+                if not cached:
+                    response = self._companyweb_http_get(
+                        url, params, vat_number)
+                tree = self._companyweb_parse(
+                    cr, uid, vat_number, lang, response, cached,
+                    context=context)
+                # error messages are not handed over, like in the cache
+                if not cached and not tree.getroot().get("Message"):
+                    lookup['response'] = response
+                if commit:
+                    cr.commit()
+            finally:
+                # the lock is held by the connection, not the transaction
+                if commit:
+                    cr.rollback()
+                cr.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))",
+                           lock)
+                if commit:
+                    cr.commit()
+        finally:
+            with _lookups_lock:
+                lookup['waiting'] -= 1
+                if not lookup['waiting']:
+                    del _lookups[key]
+        return tree
+
+    def _companyweb_parse(self, cr, uid, vat_number, lang, response, cached,
+                          context=None):
+        """ Parse a Companyweb response and cache it if it was fetched """
+        cache_model = self.pool['account.companyweb.cache']
+        try:
+            # the responses are cached as unicode, without XML declaration
+            tree = parse_xml(response).getroottree()
+        except (etree.XMLSyntaxError, ValueError):
+            # ValueError: unicode response with an encoding declaration
+            logger.error("Error parsing companyweb response for %s",
+                         vat_number, exc_info=True)
+            raise orm.except_orm('Warning !',
+                                 "System error loading Companyweb data.\n"
+                                 "Please retry and contact your "
+                                 "system administrator if the error persists.")
+        # error messages, such as wrong credentials, are not cached
+        if not cached and not tree.getroot().get("Message"):
+            cache_model.set_response(
+                cr, uid, vat_number, lang,
+                etree.tostring(tree, encoding=unicode), context=context)
+        return tree
+
+    def _companyweb_values(self, cr, uid, tree, context=None):
+        """ Return the values of the Companyweb wizard from a response """
+        message, count, firms = parse_response(tree)
         if message:
             raise orm.except_orm('Warning !',
                                  "Error loading Companyweb data:\n%s.\n"
@@ -72,101 +286,73 @@ class res_partner(orm.Model):
                                  "'cwacsone' and password 'demo' "
                                  "to obtain test credentials." % message)
 
-        if tree.xpath("/Companies")[0].get("Count") == "0":
+        if count == "0" or not firms:
             raise orm.except_orm(
                 'Warning !', "VAT number of this company is not known in the "
                 "Companyweb database")
+        return self._companyweb_firm_values(
+            cr, uid, firms[0], context=context)
 
-        firm = tree.xpath("/Companies/firm")
+    def _companyweb_firm_values(self, cr, uid, firm, context=None):
+        """ Return the values of the Companyweb wizard of a CompanywebFirm.
+            The missing values are shown as N/A, or left empty when the
+            context has companyweb_skip_missing """
+        skip_missing = (context or {}).get('companyweb_skip_missing')
 
-        startDate = firm[0].xpath("StartDate")[0].text
-        endDate = firm[0].xpath("EndDate")[0].text
-        if endDate == "0":
-            endDate = False
-            endOfActivity = False
-        else:
-            endOfActivity = True
-
-        warningstxt = ""
-        for warning in firm[0].xpath("Warnings/Warning"):
-            warningstxt = warningstxt + "- " + warning.text + "\n"
-
-        if endOfActivity:
-            fichier = "barometer_stop.png"
-            im = urllib.urlopen(
-                'http://www.companyweb.be/img/barometer/' + fichier)
-            source = im.read()
-        elif len(firm[0].xpath("Score")) > 0:
-            score = firm[0].xpath("Score")[0].text
-            if score[0] == '-':
-                signe = "neg-"
-                if len(score) == 2:
-                    chiffre = "0" + score[1:]
-                else:
-                    chiffre = score[1:]
-            else:
-                signe = "pos-"
-                if len(score) == 1:
-                    chiffre = "0" + score[0:]
-                else:
-                    chiffre = score[0:]
-
-            fichier = signe + chiffre + ".png"
-            im = urllib.urlopen(
-                'http://www.companyweb.be/img/barometer/' + fichier)
-            source = im.read()
+        def getValue(value):
+            return 'N/A' if value is None and not skip_missing else value
+
+        if skip_missing:
+            street = firm.street and ", ".join(
+                v for v in (firm.street, firm.nr) if v)
         else:
-            fichier = "barometer_none.png"
-            img_path = openerp.modules.get_module_resource(
-                'account_companyweb', 'images/barometer', fichier)
-            with open(img_path, 'rb') as f:
-                source = f.read()
-
-        image = tools.image_resize_image_medium(source.encode('base64'))
-
-        dicoRoot = dict()
-        for Element in firm[0]:
-            dicoRoot[Element.tag] = Element.text
-        balance_year = ""
-        if len(firm[0].xpath("Balans/Year")) > 0:
-            balance_year = firm[0].xpath("Balans/Year")[0].get("value")
-            for Element2 in firm[0].xpath("Balans/Year")[0]:
-                if Element2.text:
-                    dicoRoot[Element2.tag] = Element2.text
-
-        def getValue(attr):
-            return dicoRoot.get(attr, 'N/A')
-
-        def getFloatValue(attr):
-            r = dicoRoot.get(attr)
-            if r:
-                return float(r)
-            else:
-                return False
-
-        valeur = {
-            'name': getValue('Name'),
-            'jur_form': getValue('JurForm'),
-            'vat_number': "BE0" + getValue('Vat'),
-            'street': getValue('Street') + ", " + getValue('Nr'),
-            'zip': getValue('PostalCode'),
-            'city': getValue('City'),
-            'creditLimit': getFloatValue('CreditLimit'),
-            'startDate': startDate,
-            'endDate': endDate,
-            'image': image,
-            'warnings': warningstxt,
-            'url': dicoRoot['Report'],
-            'vat_liable': getValue('VATenabled') == "True",
-            'balance_year': balance_year,
-            'equityCapital': getFloatValue('Rub10_15'),
-            'addedValue': getFloatValue('Rub9800'),
-            'turnover': getFloatValue('Rub70'),
-            'result': getFloatValue('Rub9904'),
+            street = getValue(firm.street) + ", " + getValue(firm.nr)
+        return {
+            'name': getValue(firm.name),
+            'jur_form': getValue(firm.jur_form),
+            'vat_number': "BE0" + (firm.vat or 'N/A'),
+            'street': street,
+            'zip': getValue(firm.postal_code),
+            'city': getValue(firm.city),
+            'creditLimit': firm.credit_limit or False,
+            'startDate': firm.start_date,
+            'endDate': firm.end_of_activity and firm.end_date,
+            'barometer': get_barometer_name(firm.score,
+                                            firm.end_of_activity),
+            'warnings': "".join("- " + w + "\n" for w in firm.warnings),
+            'url': firm.report,
+            'vat_liable': firm.vat_enabled,
+            'balance_year': firm.balance_year and int(firm.balance_year),
+            'equityCapital': firm.equity_capital or False,
+            'addedValue': firm.added_value or False,
+            'turnover': firm.turnover or False,
+            'result': firm.result or False,
         }
 
+    def _companyweb_snapshot(self, cr, uid, ids, values, lang,
+                             context=None):
+        """ Record the Companyweb values of the partners, return the ids of
+            their snapshots """
+        snapshot_ids = self.pool['account.companyweb.snapshot'].record(
+            cr, uid, ids, values, lang, context=context)
+        return [snapshot_ids[partner_id] for partner_id in ids]
+
+    def companyweb_information(self, cr, uid, ids, vat_number, context=None):
+        # the information of the partner whose VAT number was looked up
+        partner_id = ids[-1]
+        lang = self._companyweb_lang(cr, uid, context=context)
+        snapshot_id = self.pool['account.companyweb.snapshot'].get_recent(
+            cr, uid, partner_id, 'BE' + (normalize_vat(vat_number) or ''),
+            lang, context=context)
+        if not snapshot_id:
+            tree = self._companyweb_get_tree(
+                cr, uid, vat_number, context=context)
+            valeur = self._companyweb_values(cr, uid, tree, context=context)
+            snapshot_id = self._companyweb_snapshot(
+                cr, uid, [partner_id], valeur, lang, context=context)[0]
+
         wizard_id = self.pool['account.companyweb.wizard'].create(
-            cr, uid, valeur, context=None)
+            cr, uid, {'snapshot_id': snapshot_id}, context=None)
 
         return {
             'name': "Companyweb Informations",
@@ -200,3 +386,264 @@ class res_partner(orm.Model):
             raise orm.except_orm(
                 'Error!', "Companyweb is only available for companies with a "
                 "Belgian VAT number")
+
+    def companyweb_enrich(self, cr, uid, ids, context=None):
+        """ Update the partners having a Belgian VAT number with their
+            Companyweb information, writing only the changed values. The
+            values missing from Companyweb are left unchanged. The
+            companies missing from the cache are looked up concurrently.
+            Return the number of updated partners and the list of
+            (partner name, error) """
+        context = dict(context or {}, companyweb_skip_missing=True)
+        cache_model = self.pool['account.companyweb.cache']
+        wizard_model = self.pool['account.companyweb.wizard']
+        lang = self._companyweb_lang(cr, uid, context=context)
+        partners = {}
+        for partner in self.browse(cr, uid, ids, context=context):
+            vat = (partner.vat or '').replace(' ', '')
+            if vat[:2].lower() == 'be':
+                partners.setdefault(vat[2:], []).append(partner)
+        responses = []
+        vat_numbers = []
+        for vat_number in sorted(partners):
+            response = cache_model.get_response(
+                cr, uid, vat_number, lang, context=context)
+            if response is None:
+                vat_numbers.append(vat_number)
+            else:
+                responses.append((vat_number, response, True, None))
+        fetched = self._companyweb_fetch_all(
+            cr, uid, vat_numbers, lang, context=context)
+        responses.extend((vat_number, fetched_response, False, error)
+                         for vat_number, fetched_response, error in fetched)
+        updates = []
+        errors = []
+        for vat_number, response, cached, error in responses:
+            vat_partners = partners[vat_number]
+            try:
+                if error:
+                    raise orm.except_orm(
+                        'Warning !', "System error loading Companyweb data.")
+                tree = self._companyweb_parse(
+                    cr, uid, vat_number, lang, response, cached,
+                    context=context)
+                values = companyweb_values(self._companyweb_values(
+                    cr, uid, tree, context=context))
+            except orm.except_orm, e:
+                errors += [(p.name, e.value) for p in vat_partners]
+                continue
+            self._companyweb_snapshot(
+                cr, uid, [p.id for p in vat_partners], values, lang,
+                context=context)
+            update_values = wizard_model.get_update_values(
+                cr, uid, [], values, context=context)
+            updates += [(p.id, update_values) for p in vat_partners]
+        updated_ids = self._companyweb_write_changes(
+            cr, uid, updates, context=context)
+        return len(updated_ids), errors
+
+    def _companyweb_enrich_all(self, cr, uid, context=None):
+        """ Update all the companies having a Belgian VAT number with their
+            Companyweb information. Called by the scheduled action. """
+        ids = self.search(cr, uid, [('vat', '=ilike', 'BE%'),
+                                    ('parent_id', '=', False)],
+                          context=context)
+        return self._companyweb_enrich_batches(cr, uid, ids, context=context)
+
+    def _companyweb_refresh(self, cr, uid, context=None):
+        """ Update the companies checked against Companyweb more than
+            companyweb.refresh_days days ago. The companies never checked
+            (without companyweb_date) are left to the lookups and the bulk
+            updates. Called by the scheduled action. """
+        days = int(self.pool['ir.config_parameter'].get_param(
+            cr, uid, 'companyweb.refresh_days', 30) or 0)
+        if not days:
+            return True
+        threshold = (datetime.now() - timedelta(days=days)).strftime(
+            DEFAULT_SERVER_DATETIME_FORMAT)
+        ids = self.search(cr, uid, [('companyweb_date', '<', threshold),
+                                    ('vat', '=ilike', 'BE%'),
+                                    ('parent_id', '=', False)],
+                          order='companyweb_date', context=context)
+        return self._companyweb_enrich_batches(cr, uid, ids, context=context)
+
+    def _companyweb_enrich_batches(self, cr, uid, ids, context=None):
+        """ Update the partners by batches of ENRICH_BATCH_SIZE, each one
+            committed """
+        testing = getattr(threading.currentThread(), 'testing', False)
+        for start in range(0, len(ids), ENRICH_BATCH_SIZE):
+            updated, errors = self.companyweb_enrich(
+                cr, uid, ids[start:start + ENRICH_BATCH_SIZE],
+                context=context)
+            for name, error in errors:
+                logger.warning("Companyweb enrichment of %s failed: %s",
+                               name, error)
+            if not testing:
+                cr.commit()
+        return True
+
+    def _companyweb_vat_index(self, cr, uid, context=None):
+        """ Return the ids of the companies by normalized Belgian VAT
+            number """
+        cr.execute("SELECT id, vat FROM res_partner "
+                   "WHERE vat ILIKE 'BE%%' AND parent_id IS NULL")
+        index = {}
+        for partner_id, vat in cr.fetchall():
+            vat_number = normalize_vat(vat)
+            if vat_number:
+                index.setdefault(vat_number, []).append(partner_id)
+        return index
+
+    def _companyweb_write_changes(self, cr, uid, updates, context=None):
+        """ Write the values of the (partner id, values) updates that differ
+            from the stored ones, grouping the partners with the same
+            changes in one write, and record the check of all the partners.
+            Return the ids of the updated partners """
+        if not updates:
+            return []
+        self._companyweb_set_date(
+            cr, uid, list(set(p for p, v in updates)), context=context)
+        fields_to_read = set()
+        for partner_id, values in updates:
+            fields_to_read.update(values)
+        stored = dict(
+            (r['id'], r) for r in self.read(
+                cr, uid, list(set(p for p, v in updates)),
+                list(fields_to_read), context=context))
+        changes = {}
+        for partner_id, values in updates:
+            record = stored[partner_id]
+            changed = {}
+            for field, value in values.iteritems():
+                old_value = record[field]
+                if isinstance(old_value, tuple):
+                    old_value = old_value[0]
+                if (old_value or False) != (value or False):
+                    changed[field] = value
+            if changed:
+                key = tuple(sorted(changed.iteritems()))
+                changes.setdefault(key, []).append(partner_id)
+        updated_ids = []
+        for key, partner_ids in changes.iteritems():
+            self.write(cr, uid, partner_ids, dict(key), context=context)
+            updated_ids += partner_ids
+        return updated_ids
+
+    def _companyweb_set_date(self, cr, uid, ids, context=None):
+        """ Record the check of the partners against Companyweb, without
+            the overhead of a write """
+        cr.execute("UPDATE res_partner SET companyweb_date = %s "
+                   "WHERE id IN %s",
+                   (datetime.now().strftime(DEFAULT_SERVER_DATETIME_FORMAT),
+                    tuple(ids)))
+        self.invalidate_cache(cr, uid, ['companyweb_date'], ids,
+                              context=context)
+
+    def _companyweb_import_dump(self, cr, uid, dump, context=None):
+        """ Update the companies from a Companyweb XML dump (a file object),
+            read incrementally, writing only the changed values and leaving
+            unchanged the values missing from the dump. Each batch of
+            IMPORT_BATCH_SIZE partners is committed, so an interrupted import
+            keeps the updated partners and can be run again. Return the
+            number of firms, of matching partners and of updated partners.
+            """
+        if not hasattr(dump, 'read'):
+            # iterparse_firms would open a file name
+            raise TypeError("The Companyweb dump must be a file object")
+        context = dict(context or {}, companyweb_skip_missing=True)
+        wizard_model = self.pool['account.companyweb.wizard']
+        testing = getattr(threading.currentThread(), 'testing', False)
+        index = self._companyweb_vat_index(cr, uid, context=context)
+        firm_count = matched = updated = 0
+        updates = []
+        for firm in iterparse_firms(dump):
+            firm_count += 1
+            partner_ids = index.get(normalize_vat(firm.vat))
+            if partner_ids:
+                values = companyweb_values(self._companyweb_firm_values(
+                    cr, uid, firm, context=context))
+                self._companyweb_snapshot(
+                    cr, uid, partner_ids, values, 'default', context=context)
+                update_values = wizard_model.get_update_values(
+                    cr, uid, [], values, context=context)
+                updates += [(p, update_values) for p in partner_ids]
+                matched += len(partner_ids)
+            if len(updates) >= IMPORT_BATCH_SIZE:
+                updated += len(self._companyweb_write_changes(
+                    cr, uid, updates, context=context))
+                updates = []
+                if not testing:
+                    cr.commit()
+                # do not keep the records of the batch in the cache
+                self.invalidate_cache(cr, uid, context=context)
+        updated += len(self._companyweb_write_changes(
+            cr, uid, updates, context=context))
+        return firm_count, matched, updated
+
+    def _companyweb_import_dumps(self, cr, uid, context=None):
+        """ Import the Companyweb dumps uploaded with the import wizard, as
+            the users who uploaded them, and delete them. Called by the
+            scheduled action "Import Companyweb Dumps". """
+        attachment_model = self.pool['ir.attachment']
+        testing = getattr(threading.currentThread(), 'testing', False)
+        attachment_ids = attachment_model.search(
+            cr, SUPERUSER_ID, [('res_model', '=', DUMP_RES_MODEL)],
+            order='id', context=context)
+        for attachment in attachment_model.browse(
+                cr, SUPERUSER_ID, attachment_ids, context=context):
+            level = 'INFO'
+            try:
+                result = self._companyweb_import_dump_attachment(
+                    cr, attachment.create_uid.id, attachment.id,
+                    context=context)
+            except Exception, e:
+                if testing:
+                    raise
+                # back to the last batch committed by the import
+                cr.rollback()
+                logger.exception("Error importing Companyweb dump %s",
+                                 attachment.name)
+                level = 'ERROR'
+                result = "Error: %s" % (getattr(e, 'value', None) or e)
+            self._companyweb_log_import(
+                cr, attachment.name, level, result, context=context)
+            attachment_model.unlink(cr, SUPERUSER_ID, [attachment.id],
+                                    context=context)
+            if not testing:
+                cr.commit()
+        return True
+
+    def _companyweb_import_dump_attachment(self, cr, uid, attachment_id,
+                                           context=None):
+        """ Import the Companyweb dump stored in the attachment, reading it
+            from the filestore. Return the result of the import. """
+        attachment_model = self.pool['ir.attachment']
+        attachment = attachment_model.browse(
+            cr, uid, attachment_id, context=context)
+        if attachment.store_fname:
+            with open(attachment_model._full_path(
+                    cr, uid, attachment.store_fname), 'rb') as dump:
+                counts = self._companyweb_import_dump(
+                    cr, uid, dump, context=context)
+        else:
+            counts = self._companyweb_import_dump(
+                cr, uid, StringIO(base64.b64decode(attachment.datas or '')),
+                context=context)
+        return ("%d companies read, %d partner(s) found, "
+                "%d partner(s) updated." % counts)
+
+    def _companyweb_log_import(self, cr, name, level, result, context=None):
+        """ Record the result of the import of a dump in the logs of the
+            database (Settings > Technical > Logging) """
+        logger.log(getattr(logging, level), "Companyweb dump %s imported: %s",
+                   name, result)
+        self.pool['ir.logging'].create(cr, SUPERUSER_ID, {
+            'name': 'account_companyweb',
+            'type': 'server',
+            'dbname': cr.dbname,
+            'level': level,
+            'message': "Companyweb dump %s: %s" % (name, result),
+            'path': 'account_companyweb',
+            'func': '_companyweb_import_dumps',
+            'line': '0',
+        }, context=context)
@@ -21,3 +21,4 @@
 ##############################################################################
 
 from . import test_companyweb
+from . import test_companyweb_information
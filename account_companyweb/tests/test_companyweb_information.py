@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+#
+##############################################################################
+#
+#    Copyright (c) 2014 Acsone SA/NV (http://www.acsone.eu)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from contextlib import closing
+from cStringIO import StringIO
+from datetime import datetime, timedelta
+
+from lxml import etree
+
+import openerp.tests.common as common
+from openerp.osv import orm
+from openerp.modules.module import get_module_resource
+from openerp.tools import DEFAULT_SERVER_DATETIME_FORMAT
+
+from .. import barometer, http_client
+from ..barometer import get_barometer_image, get_barometer_name
+from ..companyweb_parser import iterparse_firms, parse_response, \
+    parse_xml
+from ..model.res_partner import LOOKUP_LOCK
+
+
+def get_response():
+    """ Return the sample Companyweb response of ACSONE (0477.472.701) """
+    path = get_module_resource(
+        'account_companyweb', 'tests', 'companyweb_response.xml')
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class CompanywebHandler(BaseHTTPRequestHandler):
+    """ Stand-in of the Companyweb service, counting the requests """
+
+    requests = []
+    status = 200
+    delay = 0
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        time.sleep(self.delay)
+        if self.status != 200:
+            self.send_error(self.status)
+            return
+        body = get_response()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class companyweb_information_test(common.TransactionCase):
+
+    def setUp(self):
+        super(companyweb_information_test, self).setUp()
+        self.partner_model = self.registry('res.partner')
+        self.cache_model = self.registry('account.companyweb.cache')
+        self.partner_id = self.partner_model.create(
+            self.cr, self.uid, {'name': 'test', 'vat': 'BE0477472701'})
+        self.response = etree.tostring(
+            etree.fromstring(get_response()), encoding=unicode)
+
+    def test_cache_hit(self):
+        self.cache_model.set_response(
+            self.cr, self.uid, '0477472701', 'default', self.response)
+        action = self.partner_model.button_companyweb(
+            self.cr, self.uid, [self.partner_id], context={})
+        wizard = self.registry('account.companyweb.wizard').browse(
+            self.cr, self.uid, action['res_id'])
+        self.assertEqual(wizard.name, 'ACSONE')
+        self.assertEqual(wizard.city, u'Woluwé-Saint-Pierre')
+        self.assertEqual(wizard.creditLimit, 25000)
+        cache_ids = self.cache_model.search(
+            self.cr, self.uid, [('vat_number', '=', '0477472701')])
+        cache = self.cache_model.browse(self.cr, self.uid, cache_ids[0])
+        self.assertEqual((cache.hit_count, cache.miss_count), (1, 1))
+
+    def test_snapshot(self):
+        self.cache_model.set_response(
+            self.cr, self.uid, '0477472701', 'default', self.response)
+        wizard_model = self.registry('account.companyweb.wizard')
+        action = self.partner_model.button_companyweb(
+            self.cr, self.uid, [self.partner_id], context={})
+        wizard = wizard_model.browse(self.cr, self.uid, action['res_id'])
+        snapshot = wizard.snapshot_id
+        self.assertEqual(snapshot.partner_id.id, self.partner_id)
+        self.assertEqual(snapshot.barometer, 'barometer_none.png')
+        self.assertEqual(snapshot.balance_year, 2013)
+        self.assertEqual(wizard.turnover, 2500000)
+        self.assertTrue(wizard.image)
+        # looked up again, the latest snapshot is shown without parsing
+        # the cached response
+        action = self.partner_model.button_companyweb(
+            self.cr, self.uid, [self.partner_id], context={})
+        wizard = wizard_model.browse(self.cr, self.uid, action['res_id'])
+        self.assertEqual(wizard.snapshot_id, snapshot)
+        cache_ids = self.cache_model.search(
+            self.cr, self.uid, [('vat_number', '=', '0477472701')])
+        self.assertEqual(self.cache_model.browse(
+            self.cr, self.uid, cache_ids[0]).hit_count, 1)
+        wizard_model.update_information(
+            self.cr, self.uid, [wizard.id], context={})
+        partner = self.partner_model.browse(self.cr, self.uid,
+                                            self.partner_id)
+        self.assertEqual(partner.name, 'ACSONE')
+        self.assertEqual(partner.companyweb_snapshot_ids, [snapshot])
+        # unchanged values do not add snapshots
+        self.cache_model.set_response(
+            self.cr, self.uid, '0477472701', 'default', self.response)
+        self.partner_model.companyweb_enrich(
+            self.cr, self.uid, [self.partner_id], context={})
+        partner.refresh()
+        self.assertEqual(partner.companyweb_snapshot_ids, [snapshot])
+        self.cr.execute("UPDATE account_companyweb_snapshot "
+                        "SET \"creditLimit\" = 1000 WHERE id = %s",
+                        (snapshot.id,))
+        self.partner_model.companyweb_enrich(
+            self.cr, self.uid, [self.partner_id], context={})
+        partner.refresh()
+        self.assertEqual(len(partner.companyweb_snapshot_ids), 2)
+        self.assertEqual(partner.companyweb_snapshot_ids[0].creditLimit,
+                         25000)
+
+    def test_cache_concurrent_response(self):
+        self.cache_model.set_response(
+            self.cr, self.uid, '0477472701', 'default', self.response)
+        # a response cached by a concurrent transaction, not seen by the
+        # search of set_response
+        self.cache_model._set_response = lambda *args, **kwargs: \
+            self.cache_model.create(self.cr, self.uid, {
+                'vat_number': '0477472701',
+                'lang': 'default',
+                'response': self.response,
+                'fetch_date': '2000-01-01 00:00:00',
+                'last_access_date': '2000-01-01 00:00:00',
+            })
+        self.addCleanup(delattr, self.cache_model, '_set_response')
+        self.cache_model.set_response(
+            self.cr, self.uid, '0477472701', 'default', self.response)
+        self.assertEqual(self.cache_model.search_count(
+            self.cr, self.uid, [('vat_number', '=', '0477472701')]), 1)
+        self.assertTrue(self.cache_model.get_response(
+            self.cr, self.uid, '0477472701', 'default'))
+
+    def test_cache_expiry(self):
+        self.cache_model.set_response(
+            self.cr, self.uid, '0477472701', 'default', self.response)
+        self.cr.execute(
+            "UPDATE account_companyweb_cache SET fetch_date = %s",
+            ((datetime.now() - timedelta(hours=25)).strftime(
+                DEFAULT_SERVER_DATETIME_FORMAT),))
+        self.assertIsNone(self.cache_model.get_response(
+            self.cr, self.uid, '0477472701', 'default'))
+
+    def test_cache_eviction(self):
+        self.registry('ir.config_parameter').set_param(
+            self.cr, self.uid, 'companyweb.cache_size', '2')
+        for hours, vat_number in ((2, '0477472701'), (1, '0460392583')):
+            self.cache_model.set_response(
+                self.cr, self.uid, vat_number, 'default', self.response)
+            self.cr.execute(
+                "UPDATE account_companyweb_cache SET last_access_date = %s "
+                "WHERE vat_number = %s",
+                ((datetime.now() - timedelta(hours=hours)).strftime(
+                    DEFAULT_SERVER_DATETIME_FORMAT), vat_number))
+        self.assertTrue(self.cache_model.get_response(
+            self.cr, self.uid, '0477472701', 'default'))
+        self.cache_model.set_response(
+            self.cr, self.uid, '0403170701', 'default', self.response)
+        cache_ids = self.cache_model.search(self.cr, self.uid, [])
+        self.assertEqual(
+            sorted(c.vat_number for c in self.cache_model.browse(
+                self.cr, self.uid, cache_ids)),
+            ['0403170701', '0477472701'])
+
+    def start_server(self, set_url=True):
+        """ Start the stand-in of Companyweb and return its url, used by the
+            lookups of the test transaction if set_url """
+        server = ThreadingHTTPServer(('127.0.0.1', 0), CompanywebHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(http_client.reset_breakers)
+        del CompanywebHandler.requests[:]
+        CompanywebHandler.status = 200
+        CompanywebHandler.delay = 0
+        url = 'http://127.0.0.1:%d/alacarte_onvat.asp' % server.server_port
+        if set_url:
+            self.registry('ir.config_parameter').set_param(
+                self.cr, self.uid, 'companyweb.url', url)
+        return url
+
+    def test_enrich(self):
+        self.start_server()
+        partner_ids = [self.partner_id] + [
+            self.partner_model.create(self.cr, self.uid, {
+                'name': 'test %s' % vat, 'vat': vat})
+            for vat in ('BE0460392583', 'BE0403170701')]
+        partner_ids.append(self.partner_model.create(
+            self.cr, self.uid, {'name': 'no vat'}))
+        updated, errors = self.partner_model.companyweb_enrich(
+            self.cr, self.uid, partner_ids, context={})
+        self.assertEqual((updated, errors), (3, []))
+        self.assertEqual(len(CompanywebHandler.requests), 3)
+        for partner in self.partner_model.browse(
+                self.cr, self.uid, partner_ids[:3]):
+            self.assertEqual(partner.name, 'ACSONE')
+            self.assertEqual(partner.credit_limit, 25000)
+        # the second update is served from the cache and changes nothing
+        updated, errors = self.partner_model.companyweb_enrich(
+            self.cr, self.uid, partner_ids, context={})
+        self.assertEqual((updated, errors), (0, []))
+        self.assertEqual(len(CompanywebHandler.requests), 3)
+
+    def test_http_retry(self):
+        self.start_server()
+        url = self.registry('ir.config_parameter').get_param(
+            self.cr, self.uid, 'companyweb.url')
+        CompanywebHandler.status = 503
+        with self.assertRaises(http_client.CompanywebHTTPError):
+            http_client.get(url, retries=2, backoff=0)
+        self.assertEqual(len(CompanywebHandler.requests), 3)
+        # client errors are not retried
+        CompanywebHandler.status = 404
+        with self.assertRaises(http_client.CompanywebHTTPError):
+            http_client.get(url, retries=2, backoff=0)
+        self.assertEqual(len(CompanywebHandler.requests), 4)
+        CompanywebHandler.status = 200
+        self.assertEqual(http_client.get(url), get_response())
+
+    def test_http_circuit_breaker(self):
+        self.start_server()
+        url = self.registry('ir.config_parameter').get_param(
+            self.cr, self.uid, 'companyweb.url')
+        CompanywebHandler.status = 503
+        for i in range(http_client.FAILURE_THRESHOLD):
+            with self.assertRaises(http_client.CompanywebHTTPError):
+                http_client.get(url, retries=0)
+        # the circuit is open: the requests fail without reaching the host
+        CompanywebHandler.status = 200
+        with self.assertRaises(http_client.CircuitOpenError):
+            http_client.get(url)
+        self.assertEqual(len(CompanywebHandler.requests),
+                         http_client.FAILURE_THRESHOLD)
+        with self.assertRaises(orm.except_orm):
+            self.partner_model.button_companyweb(
+                self.cr, self.uid, [self.partner_id], context={})
+        # a trial request is let through after the reset timeout
+        http_client.get_breaker(url).opened_at -= http_client.RESET_TIMEOUT
+        self.assertEqual(http_client.get(url), get_response())
+        self.assertTrue(http_client.get_breaker(url).allow())
+
+    def test_single_flight(self):
+        """ Concurrent lookups of a company call Companyweb once """
+        # the url is not written by the test transaction, which would lock
+        # it until the end of the test
+        url = self.start_server(set_url=False)
+        CompanywebHandler.delay = 0.5
+        param_model = self.registry('ir.config_parameter')
+        vat = 'BE0999999922'
+
+        # the lookups read the url and the partner in their own transaction
+        with closing(self.registry.cursor()) as cr:
+            previous_url = param_model.get_param(cr, self.uid,
+                                                 'companyweb.url')
+            param_model.set_param(cr, self.uid, 'companyweb.url', url)
+            partner_id = self.partner_model.create(
+                cr, self.uid, {'name': 'single flight', 'vat': vat})
+            cr.commit()
+
+        def cleanup():
+            with closing(self.registry.cursor()) as cr:
+                if previous_url:
+                    param_model.set_param(cr, self.uid, 'companyweb.url',
+                                          previous_url)
+                else:
+                    param_model.unlink(cr, self.uid, param_model.search(
+                        cr, self.uid, [('key', '=', 'companyweb.url')]))
+                self.partner_model.unlink(cr, self.uid, [partner_id])
+                cr.execute("DELETE FROM account_companyweb_cache "
+                           "WHERE vat_number = %s", (vat[2:],))
+                cr.commit()
+        self.addCleanup(cleanup)
+        names = []
+        errors = []
+
+        def lookup():
+            with closing(self.registry.cursor()) as cr:
+                try:
+                    action = self.partner_model.button_companyweb(
+                        cr, self.uid, [partner_id], context={})
+                except orm.except_orm, e:
+                    errors.append(e)
+                    return
+                names.append(self.registry('account.companyweb.wizard')
+                             .browse(cr, self.uid, action['res_id']).name)
+
+        def run_lookups(count):
+            threads = [threading.Thread(target=lookup) for i in range(count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        run_lookups(3)
+        self.assertEqual(names, ['ACSONE'] * 3)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(CompanywebHandler.requests), 1)
+
+        # the lock is released when Companyweb fails
+        with closing(self.registry.cursor()) as cr:
+            cr.execute("DELETE FROM account_companyweb_cache "
+                       "WHERE vat_number = %s", (vat[2:],))
+            cr.commit()
+        CompanywebHandler.delay = 0
+        CompanywebHandler.status = 404
+        run_lookups(1)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(len(CompanywebHandler.requests), 2)
+        lock = (LOOKUP_LOCK, '%s-default' % vat[2:])
+        with closing(self.registry.cursor()) as cr:
+            cr.execute("SELECT pg_try_advisory_lock(%s, hashtext(%s))", lock)
+            self.assertTrue(cr.fetchone()[0])
+            cr.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", lock)
+        # the next lookup is not blocked and reaches Companyweb again
+        CompanywebHandler.status = 200
+        run_lookups(1)
+        self.assertEqual(names, ['ACSONE'] * 4)
+        self.assertEqual(len(CompanywebHandler.requests), 3)
+
+        # the waiting lookups get the response without the cache
+        with closing(self.registry.cursor()) as cr:
+            previous_ttl = param_model.get_param(cr, self.uid,
+                                                 'companyweb.cache_ttl')
+            param_model.set_param(cr, self.uid, 'companyweb.cache_ttl', '0')
+            cr.commit()
+
+        def restore_ttl():
+            with closing(self.registry.cursor()) as cr:
+                param_model.set_param(cr, self.uid, 'companyweb.cache_ttl',
+                                      previous_ttl or '24')
+                cr.commit()
+        self.addCleanup(restore_ttl)
+        CompanywebHandler.delay = 0.5
+        run_lookups(3)
+        self.assertEqual(names, ['ACSONE'] * 7)
+        self.assertEqual(len(CompanywebHandler.requests), 4)
+
+    def test_import_dump(self):
+        firm = etree.fromstring(get_response())[0]
+        unknown = etree.fromstring(get_response())[0]
+        unknown.find('Vat').text = '999999999'
+        dump = etree.Element('Companies')
+        dump.extend([unknown, firm])
+        other_id = self.partner_model.create(
+            self.cr, self.uid, {'name': 'other', 'vat': 'BE0403170701'})
+        self.partner_model.write(
+            self.cr, self.uid, [self.partner_id], {'vat': 'BE 0477 472 701'})
+        wizard_model = self.registry('account.companyweb.import.wizard')
+        wizard_id = wizard_model.create(self.cr, self.uid, {
+            'data_file': etree.tostring(dump).encode('base64'),
+        })
+        wizard_model.import_dump(self.cr, self.uid, [wizard_id], context={})
+        wizard = wizard_model.browse(self.cr, self.uid, wizard_id)
+        self.assertEqual(wizard.state, 'done')
+        self.assertFalse(wizard.data_file)
+        # the dump is imported and deleted by the scheduled action
+        attachment_model = self.registry('ir.attachment')
+        attachment_ids = attachment_model.search(self.cr, self.uid, [
+            ('res_model', '=', 'account.companyweb.import.wizard')])
+        self.assertEqual(len(attachment_ids), 1)
+        self.partner_model._companyweb_import_dumps(self.cr, self.uid)
+        self.assertFalse(attachment_model.exists(
+            self.cr, self.uid, attachment_ids))
+        logging_model = self.registry('ir.logging')
+        self.assertTrue(logging_model.search(self.cr, self.uid, [
+            ('func', '=', '_companyweb_import_dumps'),
+            ('message', 'like', '2 companies read, 1 partner(s) found, '
+             '1 partner(s) updated.')]))
+        partner = self.partner_model.browse(self.cr, self.uid,
+                                            self.partner_id)
+        self.assertEqual(partner.name, 'ACSONE')
+        self.assertEqual(partner.credit_limit, 25000)
+        self.assertEqual(self.partner_model.browse(
+            self.cr, self.uid, other_id).name, 'other')
+        # the values are already up to date
+        self.assertEqual(self.partner_model._companyweb_import_dump(
+            self.cr, self.uid, StringIO(etree.tostring(dump))), (2, 1, 0))
+        # the files of the server are neither read from a file name nor
+        # from an external entity
+        with self.assertRaises(TypeError):
+            self.partner_model._companyweb_import_dump(
+                self.cr, self.uid, '/etc/hostname')
+        dump = ('<?xml version="1.0"?>'
+                '<!DOCTYPE Companies ['
+                '<!ENTITY x SYSTEM "file:///etc/hostname">]>'
+                '<Companies><firm><Name>&x;</Name>'
+                '<Vat>477472701</Vat></firm></Companies>')
+        self.assertEqual([f.name for f in iterparse_firms(StringIO(dump))],
+                         [None])
+        self.assertIsNone(parse_response(parse_xml(dump))[2][0].name)
+
+    def test_import_dump_missing_values(self):
+        self.partner_model.write(self.cr, self.uid, [self.partner_id], {
+            'street': 'Rue Test, 1', 'city': 'Liege', 'credit_limit': 1000})
+        dump = ('<Companies><firm><Name>ACSONE</Name>'
+                '<Vat>477472701</Vat></firm></Companies>')
+        self.assertEqual(self.partner_model._companyweb_import_dump(
+            self.cr, self.uid, StringIO(dump)), (1, 1, 1))
+        partner = self.partner_model.browse(self.cr, self.uid,
+                                            self.partner_id)
+        self.assertEqual(partner.name, 'ACSONE')
+        # the values missing from the dump are left unchanged
+        self.assertEqual(partner.street, 'Rue Test, 1')
+        self.assertEqual(partner.city, 'Liege')
+        self.assertEqual(partner.credit_limit, 1000)
+        # the interactive lookup shows them as N/A
+        firm = iterparse_firms(StringIO(dump)).next()
+        values = self.partner_model._companyweb_firm_values(
+            self.cr, self.uid, firm)
+        self.assertEqual(values['street'], 'N/A, N/A')
+
+    def test_refresh(self):
+        self.start_server()
+        self.cache_model.set_response(
+            self.cr, self.uid, '0477472701', 'default', self.response)
+        self.partner_model.companyweb_enrich(
+            self.cr, self.uid, [self.partner_id], context={})
+        partner = self.partner_model.browse(self.cr, self.uid,
+                                            self.partner_id)
+        self.assertTrue(partner.companyweb_date)
+        self.partner_model.write(self.cr, self.uid, [self.partner_id],
+                                 {'credit_limit': 1000})
+        # not refreshed while the check is recent
+        self.partner_model._companyweb_refresh(self.cr, self.uid)
+        self.assertEqual(partner.credit_limit, 1000)
+        self.cr.execute(
+            "UPDATE res_partner SET companyweb_date = %s WHERE id = %s",
+            ((datetime.now() - timedelta(days=31)).strftime(
+                DEFAULT_SERVER_DATETIME_FORMAT), self.partner_id))
+        self.cr.execute("DELETE FROM account_companyweb_cache")
+        self.partner_model.invalidate_cache(self.cr, self.uid)
+        self.partner_model._companyweb_refresh(self.cr, self.uid)
+        partner = self.partner_model.browse(self.cr, self.uid,
+                                            self.partner_id)
+        self.assertEqual(partner.credit_limit, 25000)
+        self.assertEqual(len(CompanywebHandler.requests), 1)
+        # neither the contacts nor the companies never checked
+        contact_id = self.partner_model.create(self.cr, self.uid, {
+            'name': 'contact', 'vat': 'BE0477472701',
+            'parent_id': self.partner_id})
+        other_id = self.partner_model.create(
+            self.cr, self.uid, {'name': 'other', 'vat': 'BE0403170701'})
+        self.cr.execute(
+            "UPDATE res_partner SET companyweb_date = %s WHERE id = %s",
+            ('2000-01-01 00:00:00', contact_id))
+        self.partner_model.invalidate_cache(self.cr, self.uid)
+        self.partner_model._companyweb_refresh(self.cr, self.uid)
+        self.assertEqual(self.partner_model.browse(
+            self.cr, self.uid, contact_id).companyweb_date,
+            '2000-01-01 00:00:00')
+        self.assertFalse(self.partner_model.browse(
+            self.cr, self.uid, other_id).companyweb_date)
+        self.assertGreater(
+            partner.companyweb_date, (datetime.now() - timedelta(
+                days=1)).strftime(DEFAULT_SERVER_DATETIME_FORMAT))
+
+    def test_parse_response(self):
+        message, count, firms = parse_response(
+            etree.fromstring(get_response()))
+        self.assertEqual((message, count, len(firms)), (None, '1', 1))
+        firm = firms[0]
+        self.assertEqual(firm.name, 'ACSONE')
+        self.assertEqual(firm.city, u'Woluwé-Saint-Pierre')
+        self.assertEqual(firm.credit_limit, 25000.0)
+        self.assertTrue(firm.vat_enabled)
+        self.assertFalse(firm.end_of_activity)
+        self.assertIsNone(firm.score)
+        self.assertEqual(firm.warnings,
+                         ['Late filing of the annual accounts'])
+        self.assertEqual(firm.balance_year, '2013')
+        self.assertEqual(firm.turnover, 2500000.0)
+        path = get_module_resource(
+            'account_companyweb', 'tests', 'companyweb_response.xml')
+        self.assertEqual([f.vat for f in iterparse_firms(path)],
+                         ['477472701'])
+
+    def test_barometer(self):
+        self.assertEqual(get_barometer_name('-5'), 'neg-05.png')
+        self.assertEqual(get_barometer_name('12'), 'pos-12.png')
+        self.assertEqual(get_barometer_name('3', True), 'barometer_stop.png')
+        self.assertEqual(get_barometer_name(None), 'barometer_none.png')
+        self.assertEqual(get_barometer_name('../x'), 'barometer_none.png')
+        image = get_barometer_image('barometer_none.png')
+        self.assertTrue(image)
+        self.assertIs(get_barometer_image('barometer_none.png'), image)
+        with self.assertRaises(ValueError):
+            get_barometer_image('../../etc/passwd')
+
+    def test_barometer_unavailable(self):
+        def read_barometer(name):
+            raise http_client.CircuitOpenError("Companyweb is unavailable")
+
+        self.addCleanup(setattr, barometer, '_read_barometer',
+                        barometer._read_barometer)
+        barometer._read_barometer = read_barometer
+        barometer._images.pop('pos-07.png', None)
+        barometer._images.pop(barometer.BAROMETER_NONE, None)
+        # no image at all, but no deadlock on the fallback either
+        self.assertFalse(get_barometer_image('pos-07.png'))
+        self.assertFalse(barometer._images.get('pos-07.png'))
@@ -22,3 +22,5 @@
 
 from . import account_companyweb_wizard
 from . import account_companyweb_report_wizard
+from . import account_companyweb_enrich_wizard
+from . import account_companyweb_import_wizard
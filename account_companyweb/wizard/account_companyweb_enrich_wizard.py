@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+##############################################################################
+#
+#    Copyright (c) 2014 Acsone SA/NV (http://www.acsone.eu)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from openerp.osv import fields, orm
+
+
+class account_companyweb_enrich_wizard(orm.TransientModel):
+
+    _name = 'account.companyweb.enrich.wizard'
+    _description = 'Update partners from Companyweb'
+    _columns = {
+        'state': fields.selection([('draft', 'Draft'), ('done', 'Done')],
+                                  'State', readonly=True),
+        'result': fields.text('Result', readonly=True),
+    }
+    _defaults = {
+        'state': 'draft',
+    }
+
+    def enrich(self, cr, uid, ids, context=None):
+        partner_ids = context and context.get('active_ids') or []
+        updated, errors = self.pool['res.partner'].companyweb_enrich(
+            cr, uid, partner_ids, context=context)
+        result = "%d partner(s) updated from Companyweb." % updated
+        if errors:
+            result += "\n\nNot updated:\n" + "\n".join(
+                "%s: %s" % error for error in errors)
+        self.write(cr, uid, ids, {'state': 'done', 'result': result},
+                   context=context)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': ids[0],
+            'view_type': 'form',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': context,
+        }
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+##############################################################################
+#
+#    Copyright (c) 2014 Acsone SA/NV (http://www.acsone.eu)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from openerp.osv import fields, orm
+
+from ..model.res_partner import DUMP_RES_MODEL
+
+
+class account_companyweb_import_wizard(orm.TransientModel):
+
+    _name = 'account.companyweb.import.wizard'
+    _description = 'Import a Companyweb dump'
+    _columns = {
+        'data_file': fields.binary('Companyweb XML File', required=True),
+        'filename': fields.char('Filename'),
+        'state': fields.selection([('draft', 'Draft'), ('done', 'Done')],
+                                  'State', readonly=True),
+        'result': fields.text('Result', readonly=True),
+    }
+    _defaults = {
+        'state': 'draft',
+    }
+
+    def import_dump(self, cr, uid, ids, context=None):
+        """ Store the dump in an attachment, imported in background by the
+            scheduled action "Import Companyweb Dumps", committing its
+            batches, so that a large dump is neither bound to the duration
+            of a request nor held in memory """
+        this = self.browse(cr, uid, ids[0], context=context)
+        name = ("Companyweb dump %s" % (this.filename or '')).strip()
+        self.pool['ir.attachment'].create(cr, uid, {
+            'name': name,
+            'datas_fname': this.filename,
+            'datas': this.data_file,
+            'res_model': DUMP_RES_MODEL,
+        }, context=context)
+        result = ("The dump will be imported in background within a few "
+                  "minutes. The result of the import will be recorded in "
+                  "the logs (Settings > Technical > Logging).")
+        self.write(cr, uid, ids, {'state': 'done',
+                                  'result': result,
+                                  'data_file': False}, context=context)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': ids[0],
+            'view_type': 'form',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': context,
+        }
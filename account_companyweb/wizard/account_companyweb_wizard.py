@@ -23,47 +23,63 @@
 from openerp.osv import fields, orm
 
 
+def _related(field, type, string):
+    return fields.related('snapshot_id', field, type=type, string=string,
+                          readonly=True)
+
+
 class account_companyweb_wizard(orm.TransientModel):
 
     _name = 'account.companyweb.wizard'
+    _description = 'Companyweb information'
     _columns = {
-        'vat_number': fields.text('VAT number', readonly=True),
-        'name': fields.text('Name', readonly=True),
-        'jur_form': fields.text('Juridical Form', readonly=True),
-        'street': fields.text('Address', readonly=True),
-        'zip': fields.text('Postal code', readonly=True),
-        'city': fields.text('City', readonly=True),
-        'creditLimit': fields.float('Credit limit', readonly=True),
-        'startDate': fields.date('Start date', readonly=True),
-        'endDate': fields.date('End date', readonly=True),
-        'image': fields.binary('Health barometer', readonly=True),
-        'warnings': fields.text('Warnings', readonly=True),
-        'url': fields.char('Detailed Report', readonly=True),
-        'vat_liable': fields.boolean("Subject to VAT", readonly=True),
-        'balance_year': fields.text("Balance year", readonly=True),
-        'equityCapital': fields.float('Equity Capital', readonly=True),
-        'addedValue': fields.float('Gross Margin (+/-)', readonly=True),
-        'turnover': fields.float('Turnover', readonly=True),
-        'result': fields.float('Fiscal Year Profit/Loss (+/-)', readonly=True),
+        'snapshot_id': fields.many2one('account.companyweb.snapshot',
+                                       'Snapshot', required=True,
+                                       ondelete='cascade'),
+        'vat_number': _related('vat_number', 'char', 'VAT number'),
+        'name': _related('name', 'char', 'Name'),
+        'jur_form': _related('jur_form', 'char', 'Juridical Form'),
+        'street': _related('street', 'char', 'Address'),
+        'zip': _related('zip', 'char', 'Postal code'),
+        'city': _related('city', 'char', 'City'),
+        'creditLimit': _related('creditLimit', 'float', 'Credit limit'),
+        'startDate': _related('startDate', 'date', 'Start date'),
+        'endDate': _related('endDate', 'date', 'End date'),
+        'image': _related('image', 'binary', 'Health barometer'),
+        'warnings': _related('warnings', 'text', 'Warnings'),
+        'url': _related('url', 'char', 'Detailed Report'),
+        'vat_liable': _related('vat_liable', 'boolean', "Subject to VAT"),
+        'balance_year': _related('balance_year', 'integer', "Balance year"),
+        'equityCapital': _related('equityCapital', 'float',
+                                  'Equity Capital'),
+        'addedValue': _related('addedValue', 'float', 'Gross Margin (+/-)'),
+        'turnover': _related('turnover', 'float', 'Turnover'),
+        'result': _related('result', 'float',
+                           'Fiscal Year Profit/Loss (+/-)'),
     }
 
     def get_update_values(self, cr, uid, ids, wizard, context=None):
         """ This method is designed to be inherited to add some field to
-            update on res.partner"""
-        return {'name': wizard.name,
-                'is_company': True,
-                'street': wizard.street,
-                'city': wizard.city,
-                'zip': wizard.zip,
-                'credit_limit': wizard.creditLimit,
-                }
+            update on res.partner. The empty values are left out when the
+            context has companyweb_skip_missing, as in the bulk updates"""
+        values = {'name': wizard.name,
+                  'is_company': True,
+                  'street': wizard.street,
+                  'city': wizard.city,
+                  'zip': wizard.zip,
+                  'credit_limit': wizard.creditLimit,
+                  }
+        if (context or {}).get('companyweb_skip_missing'):
+            values = dict((field, value) for field, value
+                          in values.iteritems() if value)
+        return values
 
     def update_information(self, cr, uid, ids, context=None):
         res_partner_model = self.pool['res.partner']
-        partner_id = context['active_id']
         this = self.browse(cr, uid, ids, context=context)[0]
+        partner_id = this.snapshot_id.partner_id.id
         update_values = self.get_update_values(cr, uid, ids, this,
                                                context=context)
-        res_partner_model.write(cr, uid, [partner_id], update_values,
-                                context=context)
+        res_partner_model._companyweb_write_changes(
+            cr, uid, [(partner_id, update_values)], context=context)
         return True